@@ -2,6 +2,7 @@ from __future__ import absolute_import, unicode_literals
 
 import os
 from celery import Celery
+from celery.signals import task_prerun
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'SimpleBank.settings')
 
@@ -12,6 +13,14 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
 
+@task_prerun.connect
+def check_db_connections(**kwargs):
+    from django.conf import settings
+    from SimpleBank.utils.dbConnections import check_connections
+    if settings.DB_CONN_HEALTH_CHECKS:
+        check_connections()
+
+
 @app.task(bind=True)
 def debug_task(self):
     print('Request: {0!r}'.format(self.request))
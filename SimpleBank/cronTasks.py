@@ -1,78 +1,41 @@
-from django_cron import CronJobBase, Schedule
-from service.models import Account, Installment, Loan
-from identity.models import UserStatistic
 from django.conf import settings
-from django.utils import timezone
-from .utils.smsService import manage_sms
-
-
-class CalculateDailyInterest(CronJobBase):
-    RUN_EVERY_MIN = 1
-
-    schedule = Schedule(run_every_mins=RUN_EVERY_MIN)
-    code = 'calculate_daily_interest'    # a unique code
-
-    def update_user_statistic(self, user, amount):
-        user_statistic = UserStatistic.objects.get(user=user)
-        user_statistic.credit = amount
-        user_statistic.save()
-
-    def do(self):
-        print('calculate_daily_interest')
-        accounts = Account.objects.filter(is_active=True)
-        daily_percent = settings.YEARLY_INTEREST_PERCENT
-        for account in accounts:
-            interest = round(account.credit * daily_percent / 100 / 365)
-            account.credit = account.credit + interest
-            self.update_user_statistic(account.owner, account.credit)
-            account.save()
-
-
-class CalculateInstallations(CronJobBase):
-    RUN_EVERY_MIN = 1
-
-    schedule = Schedule(run_every_mins=RUN_EVERY_MIN)
-    code = 'calculate_installments'    # a unique code
-
-    def update_user_statistic(self, user, amount):
-        user_statistic = UserStatistic.objects.get(user=user)
-        user_statistic.debt = user_statistic.debt + amount
-        user_statistic.save()
-
-    def do(self):
-        print('calculate_installments')
-        installments = Installment.objects.filter(pay_date__lt=timezone.now(), is_settled=False)
-        for installment in installments:
-            debtor_account = Account.objects.get(owner=installment.debtor)
-            if debtor_account.credit > installment.amount:
-                debtor_account.credit = debtor_account.credit - installment.amount
-                installment.is_settled = True
-                loan = installment.loan
-                loan.remainder_installment = loan.remainder_installment - installment.amount
-                installment.save()
-                debtor_account.save()
-                loan.save()
-                self.update_user_statistic(installment.debtor, -installment.amount)
-            else:
-                manage_sms(None, installment, "installment")
-
-
-class CalculateLoans(CronJobBase):
-    RUN_EVERY_MIN = 1
-
-    schedule = Schedule(run_every_mins=RUN_EVERY_MIN)
-    code = 'calculate_loans'    # a unique code
-
-    def update_user_statistic(self, user):
-        user_statistic = UserStatistic.objects.get(user=user)
-        user_statistic.loans_unsettled = user_statistic.loans_unsettled - 1
-        user_statistic.save()
-
-    def do(self):
-        print('calculate_loans')
-        loans = Loan.objects.filter(is_settled=False)
-        for loan in loans:
-            if not Installment.objects.filter(loan=loan, is_settled=False):
-                loan.is_settled = True
-                loan.save()
-                self.update_user_statistic(loan.applicant)
+from django.db.models import Max
+from service.models import Account, Installment, Loan, JobCheckpoint
+from .utils.interestEngine import accrue_interest
+from .utils.settlementEngine import settle_installments, settle_loans
+from .utils.dbRouter import use_replica
+
+
+class PeriodicJob:
+    """
+    A periodic job split into shards of `JOB_SHARD_SIZE` consecutive ids of
+    `model`. Shard boundaries only depend on the ids, so every shard keeps its
+    checkpoint (`<code>:<shard>`) from one run to the next and a shard that
+    crashed resumes where it stopped.
+    """
+
+    def __init__(self, code, model, run):
+        self.code = code
+        self.model = model
+        self.run = run
+
+    @use_replica()
+    def shards(self):
+        last_id = self.model.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        return list(range(last_id // int(settings.JOB_SHARD_SIZE) + 1))
+
+    def run_shard(self, shard):
+        size = int(settings.JOB_SHARD_SIZE)
+        code = '%s:%d' % (self.code, shard)
+        throughput = self.run(code=code, lower=shard * size, upper=(shard + 1) * size)
+        # exported by the metrics endpoint; not every engine keeps a checkpoint of its own
+        JobCheckpoint.objects.update_or_create(code=code, defaults={'last_rows': throughput.rows,
+                                                                    'last_duration': throughput.elapsed})
+        return throughput
+
+
+CalculateDailyInterest = PeriodicJob('calculate_daily_interest', Account, accrue_interest)
+CalculateInstallations = PeriodicJob('calculate_installments', Installment, settle_installments)
+CalculateLoans = PeriodicJob('calculate_loans', Loan, settle_loans)
+
+JOBS = {job.code: job for job in (CalculateDailyInterest, CalculateInstallations, CalculateLoans)}
@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -41,16 +43,12 @@ INSTALLED_APPS = [
     'service.apps.ServiceConfig',
     'django_celery_results',
     'drf_yasg',
-    'django_cron',
-]
-
-CRON_CLASSES = [
-    "SimpleBank.cronTasks.CalculateDailyInterest",
-    "SimpleBank.cronTasks.CalculateInstallations",
-    "SimpleBank.cronTasks.CalculateLoans",
 ]
 
 MIDDLEWARE = [
+    'SimpleBank.utils.metrics.MetricsMiddleware',
+    'SimpleBank.utils.dbConnections.ConnectionHealthCheckMiddleware',
+    'SimpleBank.utils.dbRouter.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,6 +78,9 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'SimpleBank.wsgi.application'
+ASGI_APPLICATION = 'SimpleBank.asgi.application'
+# serve the read endpoints as async views, only worth it under an asgi server
+ASYNC_READ_VIEWS = int(os.environ.get("ASYNC_READ_VIEWS", default=0))
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
@@ -95,6 +96,50 @@ DATABASES = {
     }
 }
 
+# Persistent connections, tuned per process type with DB_PROFILE: web (gunicorn workers)
+# or celery (workers and beat). Kept connections are pinged before reuse when health
+# checks are on. `manage.py benchmark_connections` compares a profile with a
+# connection per request.
+DB_CONNECTION_PROFILES = {
+    'web': {
+        'CONN_MAX_AGE': int(os.environ.get("WEB_CONN_MAX_AGE", default=60)),
+        'HEALTH_CHECKS': True,
+    },
+    'celery': {
+        'CONN_MAX_AGE': int(os.environ.get("CELERY_CONN_MAX_AGE", default=300)),
+        'HEALTH_CHECKS': True,
+    },
+}
+DB_PROFILE = os.environ.get("DB_PROFILE", "web")
+if DB_PROFILE not in DB_CONNECTION_PROFILES:
+    raise ImproperlyConfigured('DB_PROFILE must be one of %s, not "%s".'
+                               % (', '.join(DB_CONNECTION_PROFILES), DB_PROFILE))
+DATABASES['default']['CONN_MAX_AGE'] = DB_CONNECTION_PROFILES[DB_PROFILE]['CONN_MAX_AGE']
+DB_CONN_HEALTH_CHECKS = DB_CONNECTION_PROFILES[DB_PROFILE]['HEALTH_CHECKS']
+
+# Read replica for reports, listings and job scans, see SimpleBank.utils.dbRouter.
+# A user's reads stick to the primary for REPLICA_STICKY_TIMEOUT seconds after their writes.
+if os.environ.get("REPLICA_SQL_HOST") or os.environ.get("REPLICA_SQL_DATABASE"):
+    DATABASES['replica'] = dict(
+        DATABASES['default'],
+        NAME=os.environ.get("REPLICA_SQL_DATABASE", DATABASES['default']['NAME']),
+        HOST=os.environ.get("REPLICA_SQL_HOST", DATABASES['default']['HOST']),
+        PORT=os.environ.get("REPLICA_SQL_PORT", DATABASES['default']['PORT']),
+        TEST={'MIRROR': 'default'},
+    )
+DATABASE_ROUTERS = ['SimpleBank.utils.dbRouter.ReplicaRouter']
+REPLICA_STICKY_TIMEOUT = int(os.environ.get("REPLICA_STICKY_TIMEOUT", default=5))
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get("CACHE_BACKEND", 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get("CACHE_LOCATION", 'simple-bank'),
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -122,6 +167,20 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
 }
 
+# Branch and Bank lookups, reloaded at the latest after this many seconds
+REFERENCE_CACHE_TIMEOUT = int(os.environ.get("REFERENCE_CACHE_TIMEOUT", default=60))
+
+# JWT
+AUTH_USER_CACHE_TIMEOUT = int(os.environ.get("AUTH_USER_CACHE_TIMEOUT", default=300))
+# trust the role/is_staff claims of the token for permission checks
+JWT_ROLE_CLAIMS = int(os.environ.get("JWT_ROLE_CLAIMS", default=0))
+
+# Metrics, exported at /metrics. Every request is counted, timings are taken
+# for a METRICS_SAMPLE_RATE share of them. Scrapers authenticate with the bearer
+# token METRICS_TOKEN; while it is empty the endpoint refuses everyone.
+METRICS_SAMPLE_RATE = float(os.environ.get("METRICS_SAMPLE_RATE", default=0.1))
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", default='')
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
 
@@ -155,6 +214,44 @@ CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Europe/London'
+CELERY_IMPORTS = ('SimpleBank.utils.celeryTasks', )
+CELERY_TASK_DEFAULT_QUEUE = 'celery'
+# notifications are I/O bound, they get their own queue and a threaded worker
+CELERY_TASK_ROUTES = {
+    'SimpleBank.utils.celeryTasks.send_SMS': {'queue': 'notifications'},
+    'SimpleBank.utils.celeryTasks.dispatch_sms_outbox': {'queue': 'notifications'},
+}
+CELERY_NOTIFICATION_IGNORE_RESULT = int(os.environ.get("CELERY_NOTIFICATION_IGNORE_RESULT", default=1))
+CELERY_RESULT_EXPIRES = int(os.environ.get("CELERY_RESULT_EXPIRES", default=3600))
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.environ.get("CELERY_WORKER_PREFETCH_MULTIPLIER", default=4))
+
+# periodic jobs, see SimpleBank/cronTasks.py
+CELERY_BEAT_SCHEDULE = {
+    'calculate_daily_interest': {
+        'task': 'SimpleBank.utils.celeryTasks.run_periodic_job',
+        'schedule': 60.0,
+        'args': ('calculate_daily_interest', ),
+    },
+    'calculate_installments': {
+        'task': 'SimpleBank.utils.celeryTasks.run_periodic_job',
+        'schedule': 60.0,
+        'args': ('calculate_installments', ),
+    },
+    'calculate_loans': {
+        'task': 'SimpleBank.utils.celeryTasks.run_periodic_job',
+        'schedule': 60.0,
+        'args': ('calculate_loans', ),
+    },
+    # picks up outbox rows whose dispatch was never scheduled
+    'dispatch_sms_outbox': {
+        'task': 'SimpleBank.utils.celeryTasks.dispatch_sms_outbox',
+        'schedule': 60.0,
+    },
+    'purge_sms_outbox': {
+        'task': 'SimpleBank.utils.celeryTasks.purge_sms_outbox',
+        'schedule': 3600.0,
+    },
+}
 
 # APP SETTING
 MIN_ACCOUNT_BALANCE = 10000
@@ -164,3 +261,18 @@ MAX_TRANSACTION_AMOUNT_DAILY = 3000000
 MIN_LOAN_AMOUNT = 1000000
 MAX_LOAN_AMOUNT = 10000000
 YEARLY_INTEREST_PERCENT = 10
+ACCOUNT_NUMBER_BASE = 600000000000000
+ACCOUNT_NUMBER_BLOCK_SIZE = 1000
+INTEREST_BATCH_SIZE = 5000
+INSTALLMENT_BATCH_SIZE = 1000
+LOAN_BATCH_SIZE = 500
+STATISTIC_RECONCILE_BATCH_SIZE = 1000
+STATISTIC_LIST_CACHE_TIMEOUT = 30
+JOB_SHARD_SIZE = 100000
+JOB_LOCK_TTL = 900
+SMS_DISPATCH_DELAY = 2
+SMS_DISPATCH_BATCH_SIZE = 500
+# sent outbox rows are deleted after this many days
+SMS_OUTBOX_RETENTION_DAYS = 7
+SMS_GATEWAY_URL = os.environ.get("SMS_GATEWAY_URL", "")
+SMS_GATEWAY_TIMEOUT = 5
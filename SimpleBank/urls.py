@@ -20,6 +20,7 @@ from rest_framework_swagger.views import get_swagger_view
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from SimpleBank.utils.metrics import metrics_view
 
 schema_view = get_schema_view(
    openapi.Info(
@@ -39,6 +40,7 @@ urlpatterns = [
     path('api/user/', include('identity.urls')),
     path('api/manage/', include('manage.urls')),
     path('api/service/', include('service.urls')),
+    path('metrics', metrics_view),
     url(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     url(r'^swagger/$', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     url(r'^redoc/$', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
@@ -1,10 +1,71 @@
 import jwt
 
 from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
 
 from rest_framework import authentication, exceptions
 
 from identity.models import User
+from .dbRouter import set_current_user
+
+
+def user_cache_key(mobile):
+    return 'auth:user:%s' % mobile
+
+
+def get_user(mobile):
+    """
+    Resolve the user of a token, from the cache when possible. Entries expire
+    after `AUTH_USER_CACHE_TIMEOUT` seconds and are dropped whenever the user
+    is saved or deleted.
+    """
+    key = user_cache_key(mobile)
+    user = cache.get(key)
+    if user is None:
+        user = User.objects.get(mobile=mobile)
+        cache.set(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+    return user
+
+
+def forget_user(mobile):
+    cache.delete(user_cache_key(mobile))
+
+
+class ClaimsUser(SimpleLazyObject):
+    """
+    The authenticated user as described by the token claims. Permission checks
+    only need `role` and `is_staff`, which are answered from the claims; the
+    real user is loaded the first time anything else is asked for.
+    """
+
+    def __init__(self, payload, func):
+        self.__dict__['_claims'] = payload
+        super().__init__(func)
+
+    @property
+    def id(self):
+        return self._claims['id']
+
+    pk = id
+
+    @property
+    def mobile(self):
+        return self._claims['mobile']
+
+    @property
+    def role(self):
+        return self._claims['role']
+
+    @property
+    def is_staff(self):
+        return self._claims['is_staff']
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __bool__(self):
+        return True
 
 
 class JWTAuthentication(authentication.BaseAuthentication):
@@ -82,10 +143,15 @@ class JWTAuthentication(authentication.BaseAuthentication):
             msg = 'Invalid authentication. The token sent is invalid.'
             raise exceptions.AuthenticationFailed(msg)
 
+        set_current_user(payload['mobile'])
+        if settings.JWT_ROLE_CLAIMS and 'role' in payload:
+            return ClaimsUser(payload, lambda: self._get_user(payload)), token
+
+        return self._get_user(payload), token
+
+    def _get_user(self, payload):
         try:
-            user = User.objects.get(mobile=payload['mobile'])
+            return get_user(payload['mobile'])
         except User.DoesNotExist:
             msg = 'No user found with the token sent.'
             raise exceptions.AuthenticationFailed(msg)
-
-        return user, token
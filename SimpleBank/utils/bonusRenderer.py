@@ -1,12 +1,37 @@
 import json
 
 from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from .metrics import timer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+encoder = JSONEncoder()
+
+
+def fast_dumps(data):
+    # orjson knows dicts, lists, strings and numbers; anything else (Decimal, lazy strings, ...)
+    # goes through the same encoder rest framework uses
+    return orjson.dumps(data, default=encoder.default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def std_dumps(data):
+    return json.dumps(data, cls=JSONEncoder).encode('utf-8')
 
 
 class BonusResponseRenderer(JSONRenderer):
     charset = 'utf-8'
+    # pluggable encoder, must return bytes
+    dumps = staticmethod(fast_dumps if orjson is not None else std_dumps)
 
     def render(self, data, media_type=None, renderer_context=None):
+        with timer('render_seconds', renderer=type(self).__name__):
+            return self.render_payload(data)
+
+    def render_payload(self, data):
         message = 'successfully done.'
         if data is not None:
             if not isinstance(data, list):
@@ -14,35 +39,35 @@ class BonusResponseRenderer(JSONRenderer):
                 detail = data.get('detail', None)
                 if errors is not None:
                     message = json.dumps(errors)
-                    if isinstance(message, dict):
-                        if len(message) == 1 and message.get("error") is not None:
-                            message = str(message["error"]).replace('[', '').replace(']', '').replace('\'', '')
-                        else:
-                            for x in message:
-                                message[x] = str(message[x]).replace('[', '').replace(']', '').replace('\'', '')
-                    elif isinstance(message, list):
-                        message = str(message).replace('[', '').replace(']', '').replace('\'', '')
                     data = None
                 elif detail is not None:
                     data = None
-                    message = ""
-                    message = get_the_string(errors, message)
-                    message += get_the_string(detail, message)
-        return json.dumps({
+                    message = get_the_string(detail)
+        return self.dumps({
             'data': data,
             'message': message
         })
 
 
-def get_the_string(data, message):
+def get_the_string(data, message=''):
+    """
+    Flatten an error payload into one line. Leaves are emitted last-first,
+    each followed by a space, and a `None` leaf drops everything collected
+    before it, exactly like the recursive version this replaces.
+    """
     if data is None:
         return ''
-    if isinstance(data, dict):
-        for x in data:
-            message = get_the_string(data[x], message)
-    elif isinstance(data, list):
-        for x in data:
-            message = get_the_string(x, message)
-    else:
-        return str(data) + ' ' + message
-    return message
+    words = []
+    stack = [data]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            stack.extend(reversed(list(item.values())))
+        elif isinstance(item, list):
+            stack.extend(reversed(item))
+        elif item is None:
+            words = []
+            message = ''
+        else:
+            words.append(str(item))
+    return ''.join(word + ' ' for word in reversed(words)) + message
@@ -1,9 +1,83 @@
 from __future__ import absolute_import, unicode_literals
 
-from celery import shared_task
+import threading
+
+import requests
+from celery import shared_task, chord
 from celery.utils.log import get_task_logger
+from django.conf import settings
+
+logger = get_task_logger(__name__)
+local = threading.local()
+
+
+def gateway_session():
+    # one keep-alive session per pool thread
+    session = getattr(local, 'session', None)
+    if session is None:
+        session = local.session = requests.Session()
+    return session
 
 
-@shared_task(bind=True, track_started=True)
+@shared_task(bind=True, ignore_result=bool(settings.CELERY_NOTIFICATION_IGNORE_RESULT),
+             autoretry_for=(requests.RequestException, ), retry_backoff=True, max_retries=5)
 def send_SMS(self, message):
+    # a single message, or a list of [mobile, message] pairs from the outbox
+    if settings.SMS_GATEWAY_URL:
+        messages = message if isinstance(message, list) else [[None, message]]
+        response = gateway_session().post(settings.SMS_GATEWAY_URL,
+                                          json={'messages': [{'mobile': mobile, 'text': text}
+                                                             for mobile, text in messages]},
+                                          timeout=settings.SMS_GATEWAY_TIMEOUT)
+        response.raise_for_status()
     return message
+
+
+@shared_task(bind=True, ignore_result=bool(settings.CELERY_NOTIFICATION_IGNORE_RESULT))
+def dispatch_sms_outbox(self):
+    from SimpleBank.utils.smsService import dispatch_outbox
+    return dispatch_outbox()
+
+
+@shared_task(bind=True, ignore_result=bool(settings.CELERY_NOTIFICATION_IGNORE_RESULT))
+def purge_sms_outbox(self):
+    from SimpleBank.utils.smsService import purge_outbox
+    return purge_outbox()
+
+
+@shared_task(bind=True)
+def run_periodic_job(self, code):
+    """
+    Fan a periodic job out as one task per shard. The job lock is held until
+    every shard has finished, so runs never overlap: every shard pushes its
+    expiry ahead when it starts and when it ends, and the lock is released
+    whether the shards succeed or fail.
+    """
+    from SimpleBank.cronTasks import JOBS
+    from SimpleBank.utils.jobLock import acquire_job_lock
+    job = JOBS[code]
+    token = acquire_job_lock(code)
+    if token is None:
+        return '%s: previous run still in progress' % code
+    callback = finish_periodic_job.si(code, token).on_error(finish_periodic_job.si(code, token))
+    chord([run_job_shard.s(code, shard, token) for shard in job.shards()])(callback)
+    return token
+
+
+@shared_task(bind=True)
+def run_job_shard(self, code, shard, token=None):
+    from SimpleBank.cronTasks import JOBS
+    from SimpleBank.utils.jobLock import extend_job_lock
+    if token is not None:
+        extend_job_lock(code, token)
+    throughput = JOBS[code].run_shard(shard)
+    if token is not None:
+        extend_job_lock(code, token)
+    logger.info(throughput)
+    return str(throughput)
+
+
+@shared_task(bind=True)
+def finish_periodic_job(self, code, token):
+    from SimpleBank.utils.jobLock import release_job_lock
+    release_job_lock(code, token)
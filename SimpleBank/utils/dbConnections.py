@@ -0,0 +1,41 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+def check_connections(**kwargs):
+    """
+    Drop persistent connections the server has closed in the meantime (idle
+    timeout, restart, failover), so the next query opens a fresh one instead
+    of failing. Only connections kept open from an earlier request or task
+    are pinged.
+    """
+    for connection in connections.all():
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
+
+
+class ConnectionHealthCheckMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DB_CONN_HEALTH_CHECKS:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        check_connections()
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        # sync views run on Django's shared thread, async views check their own thread's connections
+        await sync_to_async(check_connections, thread_sensitive=True)()
+        return await self.get_response(request)
@@ -0,0 +1,93 @@
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA = 'replica'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+_current_user = ContextVar('replica_user', default=None)
+
+
+def sticky_key(user):
+    return 'db:sticky:%s' % user
+
+
+def set_current_user(user):
+    # writes made from now on pin `user` to the primary
+    _current_user.set(user)
+
+
+@contextmanager
+def use_replica():
+    """
+    Send the reads of the block, or of the decorated function, to the replica.
+    Reads inside a transaction, reads of a user who wrote in the last
+    `REPLICA_STICKY_TIMEOUT` seconds and locking reads stay on the primary.
+    """
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Everything goes to the primary unless the code asked for the replica with
+    `use_replica`. Without a `replica` database configured this router is a
+    no-op.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or REPLICA not in settings.DATABASES:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        user = _current_user.get()
+        if user is not None and cache.get(sticky_key(user)):
+            return None
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        user = _current_user.get()
+        if user is not None:
+            cache.set(sticky_key(user), True, settings.REPLICA_STICKY_TIMEOUT)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
+
+
+class ReplicaRoutingMiddleware:
+    """Scope the current user to the request, a thread never carries it over to the next one."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = _current_user.set(None)
+        try:
+            return self.get_response(request)
+        finally:
+            _current_user.reset(token)
+
+    async def __acall__(self, request):
+        token = _current_user.set(None)
+        try:
+            return await self.get_response(request)
+        finally:
+            _current_user.reset(token)
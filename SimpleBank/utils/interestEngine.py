@@ -0,0 +1,94 @@
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from service.models import Account, JobCheckpoint, InterestAccrual
+from .batching import id_chunks, id_range, KeyedCase, Throughput
+from .statisticService import StatisticBuffer
+
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def pending_days(last_accrued, business_date):
+    # an account that never got interest starts accruing on the current business date
+    if last_accrued is None:
+        return [business_date]
+    days = []
+    day = last_accrued + ONE_DAY
+    while day <= business_date:
+        days.append(day)
+        day += ONE_DAY
+    return days
+
+
+def accrue_chunk(accounts, business_date):
+    """
+    Accrue every day an account of the chunk is missing up to `business_date`
+    and record each (account, day) in the accrual ledger, crediting the paid
+    interest to the owners' statistics. The accounts are row-locked for the
+    duration of the caller's transaction.
+    """
+    daily_percent = settings.YEARLY_INTEREST_PERCENT
+    balances = list(accounts.select_for_update().order_by('id').values_list('id', 'owner_id', 'credit'))
+    last_accrued = dict(InterestAccrual.objects.filter(account_id__in=[pk for pk, _, _ in balances])
+                        .values('account_id').annotate(last=Max('business_date'))
+                        .values_list('account_id', 'last'))
+    accruals = []
+    credits = {}
+    statistics = StatisticBuffer()
+    for pk, owner_id, credit in balances:
+        days = pending_days(last_accrued.get(pk), business_date)
+        if not days:
+            continue
+        for day in days:
+            interest = round(credit * daily_percent / 100 / 365)
+            credit = credit + interest
+            accruals.append(InterestAccrual(account_id=pk, business_date=day, amount=interest))
+            statistics.add(owner_id, credit=interest)
+        credits[pk] = credit
+    InterestAccrual.objects.bulk_create(accruals)
+    if credits:
+        # the rows are locked, the new balances are set outright
+        Account.objects.filter(id__in=list(credits)).update(credit=KeyedCase('id', credits))
+    statistics.flush()
+    return len(credits)
+
+
+def accrue_interest(code='calculate_daily_interest', batch_size=None, business_date=None, lower=0, upper=None):
+    """
+    Bring every active account's interest up to `business_date` (today by
+    default), one chunk of accounts per transaction.
+
+    Accrual is idempotent: the ledger holds one row per (account, day), so an
+    account is never paid twice for the same day, and days missed while the
+    job was down are caught up in the same pass. The run state in
+    `JobCheckpoint` makes every tick after the day's pass has completed a
+    single query, and lets a crashed pass resume after its last chunk.
+
+    `lower` and `upper` limit the pass to a shard of account ids; every shard
+    keeps its own checkpoint under its own `code`.
+    """
+    batch_size = batch_size or int(settings.INTEREST_BATCH_SIZE)
+    business_date = business_date or timezone.localdate()
+    throughput = Throughput(code)
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(code=code)
+    if checkpoint.business_date == business_date and checkpoint.is_completed:
+        return throughput
+    if checkpoint.business_date != business_date:
+        checkpoint.business_date = business_date
+        checkpoint.watermark = 0
+        checkpoint.is_completed = False
+        checkpoint.save(update_fields=['business_date', 'watermark', 'is_completed', 'updated_at'])
+
+    active_accounts = id_range(Account.objects.filter(is_active=True), lower, upper)
+    for ids in id_chunks(active_accounts, checkpoint.watermark, batch_size):
+        with transaction.atomic():
+            chunk = active_accounts.filter(id__gte=ids[0], id__lte=ids[-1])
+            throughput.add(accrue_chunk(chunk, business_date))
+            checkpoint.watermark = ids[-1]
+            checkpoint.save(update_fields=['watermark', 'updated_at'])
+    checkpoint.is_completed = True
+    checkpoint.save(update_fields=['is_completed', 'updated_at'])
+    return throughput
@@ -0,0 +1,36 @@
+import datetime
+import uuid
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from service.models import JobCheckpoint
+
+
+def acquire_job_lock(code, ttl=None):
+    """
+    Take the run lock of a periodic job. The lock lives on the job's
+    checkpoint row and is taken with one conditional `UPDATE`, so it holds
+    across every worker sharing the database. Returns the lock token, or
+    `None` when another run still holds it. A lock nobody releases expires
+    after `ttl` seconds.
+    """
+    ttl = ttl or int(settings.JOB_LOCK_TTL)
+    JobCheckpoint.objects.get_or_create(code=code)
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    acquired = JobCheckpoint.objects.filter(code=code) \
+        .filter(Q(locked_until__isnull=True) | Q(locked_until__lt=now)) \
+        .update(lock_token=token, locked_until=now + datetime.timedelta(seconds=ttl))
+    return token if acquired else None
+
+
+def extend_job_lock(code, token, ttl=None):
+    """Push the expiry of a lock still held under `token` `ttl` seconds ahead; `False` if it was lost."""
+    ttl = ttl or int(settings.JOB_LOCK_TTL)
+    return bool(JobCheckpoint.objects.filter(code=code, lock_token=token)
+                .update(locked_until=timezone.now() + datetime.timedelta(seconds=ttl)))
+
+
+def release_job_lock(code, token):
+    JobCheckpoint.objects.filter(code=code, lock_token=token).update(lock_token='', locked_until=None)
@@ -0,0 +1,88 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import serializers
+from service.enums import TransactionType
+from service.models import Account, Transaction, DailyTransactionUsage
+from . import exceptions
+from .statisticService import StatisticBuffer
+
+
+def lock_accounts(*accounts):
+    """
+    Row-lock the given accounts, always in id order so two transfers between
+    the same pair of accounts can never deadlock each other.
+    """
+    ids = sorted({account.id for account in accounts if account is not None})
+    locked = {account.id: account for account in
+              Account.objects.select_for_update().filter(id__in=ids, is_active=True).order_by('id')}
+    if len(locked) != len(ids):
+        raise serializers.ValidationError('Account is not active.')
+    return locked
+
+
+def check_amount(account, amount):
+    if account.credit - amount < int(settings.MIN_ACCOUNT_BALANCE):
+        raise exceptions.MinBalanceLimit
+
+
+def reserve_daily_amount(owner, amount):
+    """
+    Add `amount` to the owner's usage of the day, refusing it when the daily
+    limit would be exceeded. The check and the increment are one conditional
+    `UPDATE` on a single row, so parallel postings cannot both slip under the
+    limit.
+    """
+    today = timezone.localdate()
+    limit = int(settings.MAX_TRANSACTION_AMOUNT_DAILY) - amount
+    usage = DailyTransactionUsage.objects.filter(user=owner, date=today, amount__lte=limit)
+    if usage.update(amount=F('amount') + amount):
+        return
+    # first posting of the day, or the limit is reached
+    DailyTransactionUsage.objects.get_or_create(user=owner, date=today)
+    if not usage.update(amount=F('amount') + amount):
+        raise exceptions.AccountLimitExceeded
+
+
+def post_transaction(owner, type, amount, dest_account, src_account=None):
+    """
+    Post a transaction: count it against the owner's daily limit, move the
+    balances, record the `Transaction` and adjust the owners' statistics in
+    a single database transaction. Balances
+    are changed with `F()` deltas on locked rows, so concurrent postings on
+    the same accounts are serialized by the database instead of overwriting
+    each other.
+    """
+    balance_deltas = defaultdict(int)
+    statistics = StatisticBuffer()
+    with transaction.atomic():
+        reserve_daily_amount(owner, amount)
+        locked = lock_accounts(dest_account, src_account)
+        dest_account = locked[dest_account.id]
+        if type == TransactionType.DEPOSIT_CASH.value:
+            balance_deltas[dest_account.id] += amount
+            statistics.add(dest_account.owner_id, credit=+amount)
+        elif type == TransactionType.DEPOSIT.value:
+            src_account = locked[src_account.id]
+            check_amount(src_account, amount)
+            balance_deltas[dest_account.id] += amount
+            balance_deltas[src_account.id] -= amount
+            statistics.add(src_account.owner_id, credit=-amount)
+            statistics.add(dest_account.owner_id, credit=+amount)
+        else:
+            check_amount(dest_account, amount)
+            balance_deltas[dest_account.id] -= amount
+            statistics.add(dest_account.owner_id, credit=-amount)
+
+        for account_id, delta in balance_deltas.items():
+            if delta:
+                Account.objects.filter(id=account_id).update(credit=F('credit') + delta)
+        statistics.flush()
+        return Transaction.objects.create(owner=owner,
+                                          src_account=src_account,
+                                          dest_account=dest_account,
+                                          amount=amount,
+                                          type=type)
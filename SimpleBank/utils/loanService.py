@@ -0,0 +1,123 @@
+import datetime
+from functools import lru_cache
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Case, When, Value, IntegerField
+from service.models import Account, Loan, Installment
+from .smsService import manage_bulk_sms
+from .statisticService import StatisticBuffer, apply_deltas
+
+
+@lru_cache(maxsize=64)
+def schedule_dates(start, months):
+    # shared by every loan originated the same day with the same term
+    return tuple(start + relativedelta(months=month) for month in range(1, months + 1))
+
+
+def split_amount(amount, count):
+    """Equal installments, the last one absorbing the remainder so they sum to `amount`."""
+    installment = amount // count
+    return [installment] * (count - 1) + [amount - installment * (count - 1)]
+
+
+def build_installments(loan, start=None):
+    months = int(loan.type)
+    dates = schedule_dates(start or datetime.date.today(), months)
+    return [Installment(debtor_id=loan.applicant_id, loan=loan, amount=amount, pay_date=pay_date)
+            for amount, pay_date in zip(split_amount(loan.amount, months), dates)]
+
+
+def new_loan(applicant, branch, amount, type):
+    return Loan(applicant=applicant, branch=branch, amount=amount, type=type,
+                remainder_installment=amount, open_installments=int(type))
+
+
+def originate_loan(applicant, branch, amount, type, account):
+    """
+    Grant a loan: create it with its whole installment schedule in one
+    `bulk_create`, pay the amount into `account` with an `F()` update and
+    count it in the applicant's statistics, all in one transaction.
+    """
+    with transaction.atomic():
+        loan = new_loan(applicant, branch, amount, type)
+        loan.save()
+        Installment.objects.bulk_create(build_installments(loan))
+        Account.objects.filter(pk=account.pk).update(credit=F('credit') + amount)
+        apply_deltas(applicant.id, loans_gotten=1, loans_unsettled=1, debt=amount, credit=amount)
+    return loan
+
+
+def consecutive_ids():
+    """
+    The id step of a multi-row `INSERT` on MySQL, or None when its ids may not
+    be consecutive. InnoDB hands such a statement one run of ids unless it
+    runs in the interleaved lock mode (2).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT @@innodb_autoinc_lock_mode, @@auto_increment_increment')
+        lock_mode, step = cursor.fetchone()
+    return step if lock_mode < 2 else None
+
+
+def save_loans(loans):
+    # the loans are needed as installment foreign keys, so their ids must be known after the insert
+    if connection.features.can_return_rows_from_bulk_insert:
+        return Loan.objects.bulk_create(loans)
+    step = consecutive_ids() if connection.vendor == 'mysql' else None
+    if step is None:
+        for loan in loans:
+            loan.save()
+        return loans
+    Loan.objects.bulk_create(loans)
+    with connection.cursor() as cursor:
+        # the id of the first row of the insert
+        cursor.execute('SELECT LAST_INSERT_ID()')
+        first = cursor.fetchone()[0]
+    for offset, loan in enumerate(loans):
+        loan.id = first + offset * step
+    return loans
+
+
+def originate_loans(applications, batch_size=None):
+    """
+    Grant many loans at once, e.g. a branch promotion import. `applications`
+    is an iterable of dicts with `applicant`, `branch`, `amount` and `type`.
+    Every chunk of `LOAN_BATCH_SIZE` applications is one transaction writing
+    the loans, all their installments, the disbursements and the statistics
+    with a handful of statements. Applicants without an active account are
+    skipped. Returns the created loans.
+    """
+    batch_size = batch_size or int(settings.LOAN_BATCH_SIZE)
+    applications = list(applications)
+    created = []
+    for start in range(0, len(applications), batch_size):
+        chunk = applications[start:start + batch_size]
+        with transaction.atomic():
+            accounts = {}
+            for account_id, owner_id in Account.objects.select_for_update() \
+                    .filter(owner_id__in={application['applicant'].id for application in chunk}, is_active=True) \
+                    .order_by('id').values_list('id', 'owner_id'):
+                accounts.setdefault(owner_id, account_id)
+            loans = save_loans([new_loan(**application) for application in chunk
+                                if application['applicant'].id in accounts])
+            if not loans:
+                continue
+            Installment.objects.bulk_create([installment for loan in loans for installment in build_installments(loan)])
+
+            disbursements = {}
+            statistics = StatisticBuffer()
+            for loan in loans:
+                account_id = accounts[loan.applicant_id]
+                disbursements[account_id] = disbursements.get(account_id, 0) + loan.amount
+                statistics.add(loan.applicant_id, loans_gotten=1, loans_unsettled=1, debt=loan.amount,
+                               credit=loan.amount)
+            Account.objects.filter(id__in=list(disbursements)).update(
+                credit=F('credit') + Case(*[When(id=account_id, then=Value(amount))
+                                            for account_id, amount in disbursements.items()],
+                                          default=Value(0), output_field=IntegerField()))
+            statistics.flush()
+            manage_bulk_sms([(loan.applicant, loan, 'loan') for loan in loans])
+        created.extend(loans)
+    return created
@@ -0,0 +1,269 @@
+import asyncio
+import hmac
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework import serializers
+
+PREFIX = 'simplebank_'
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_sampled = ContextVar('metrics_sampled', default=False)
+_queries = ContextVar('metrics_queries', default=None)
+
+
+class Registry:
+    """
+    In-process counters and histograms. Every thread records into its own
+    shard, so recording takes no lock; shards are only merged when the
+    metrics are exported.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        # only taken once per thread, when its shard is created
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = ({}, {})
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def inc(self, name, value=1, **labels):
+        counters = self._shard()[0]
+        key = (name, tuple(sorted(labels.items())))
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        histograms = self._shard()[1]
+        key = (name, tuple(sorted(labels.items())))
+        histogram = histograms.get(key)
+        if histogram is None:
+            # one slot per bucket, one for +Inf, then the sum
+            histogram = histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        histogram[bisect_left(BUCKETS, value)] += 1
+        histogram[-1] += value
+
+    def collect(self):
+        with self._lock:
+            shards = list(self._shards)
+        counters, histograms = {}, {}
+        for shard_counters, shard_histograms in shards:
+            for key, value in dict(shard_counters).items():
+                counters[key] = counters.get(key, 0) + value
+            for key, histogram in dict(shard_histograms).items():
+                merged = histograms.setdefault(key, [0] * len(histogram))
+                for i, value in enumerate(list(histogram)):
+                    merged[i] += value
+        return counters, histograms
+
+
+metrics = Registry()
+
+
+def sampled():
+    # timers only record inside the requests picked by the sampler
+    return _sampled.get()
+
+
+@contextmanager
+def timer(name, **labels):
+    if not sampled():
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe(name, time.perf_counter() - started, **labels)
+
+
+def format_labels(labels, **extra):
+    labels = labels + tuple(extra.items())
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                             for key, value in labels)
+
+
+def render_metrics(counters, histograms, gauges=()):
+    lines = []
+    seen = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append('# TYPE %s%s counter' % (PREFIX, name))
+        lines.append('%s%s%s %s' % (PREFIX, name, format_labels(labels), value))
+    for (name, labels), histogram in sorted(histograms.items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append('# TYPE %s%s histogram' % (PREFIX, name))
+        count = 0
+        for bound, value in zip(BUCKETS + ('+Inf', ), histogram):
+            count += value
+            lines.append('%s%s_bucket%s %d' % (PREFIX, name, format_labels(labels, le=bound), count))
+        lines.append('%s%s_sum%s %s' % (PREFIX, name, format_labels(labels), histogram[-1]))
+        lines.append('%s%s_count%s %d' % (PREFIX, name, format_labels(labels), count))
+    for name, labels, value in gauges:
+        if name not in seen:
+            seen.add(name)
+            lines.append('# TYPE %s%s gauge' % (PREFIX, name))
+        lines.append('%s%s%s %s' % (PREFIX, name, format_labels(labels), value))
+    return '\n'.join(lines) + '\n'
+
+
+def job_gauges():
+    """
+    Rows and seconds of the last run of every periodic job, summed over its
+    shards. They come from the job checkpoints, so the figures of the celery
+    workers show up here as well.
+    """
+    from service.models import JobCheckpoint
+    rows, seconds = {}, {}
+    for code, last_rows, last_duration in JobCheckpoint.objects.values_list('code', 'last_rows', 'last_duration'):
+        job = code.split(':')[0]
+        rows[job] = rows.get(job, 0) + last_rows
+        seconds[job] = seconds.get(job, 0) + last_duration
+    for job in sorted(rows):
+        yield 'job_last_run_rows', (('job', job), ), rows[job]
+        yield 'job_last_run_seconds', (('job', job), ), seconds[job]
+
+
+def authorized(request):
+    # scrapers send `Authorization: Bearer <METRICS_TOKEN>`, without a token configured nobody gets in
+    if not settings.METRICS_TOKEN:
+        return False
+    expected = 'Bearer %s' % settings.METRICS_TOKEN
+    return hmac.compare_digest(request.headers.get('Authorization', '').encode(), expected.encode())
+
+
+def metrics_view(request):
+    if not authorized(request):
+        return HttpResponseForbidden()
+    counters, histograms = metrics.collect()
+    return HttpResponse(render_metrics(counters, histograms, job_gauges()), content_type=CONTENT_TYPE)
+
+
+class QueryRecorder:
+    """`execute_wrapper` counting the queries of a request and the time they take."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+@contextmanager
+def sampled_request():
+    """Turn the timers on for the current request and collect its queries into the returned recorder."""
+    recorder = QueryRecorder()
+    sampled_token = _sampled.set(True)
+    queries_token = _queries.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _queries.reset(queries_token)
+        _sampled.reset(sampled_token)
+
+
+@contextmanager
+def recording_queries():
+    """
+    Feed the queries the current thread runs into the recorder of the
+    sampled request, if any. Connections are per thread, so code that runs
+    a request's queries on another thread enters this there as well.
+    """
+    recorder = _queries.get()
+    with ExitStack() as stack:
+        if recorder is not None:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+        yield
+
+
+class MetricsMiddleware:
+    """
+    Count every request, and for a `METRICS_SAMPLE_RATE` share of them record
+    the latency and the database queries per route. Serializer and render
+    timers only run in the sampled requests. Under ASGI the queries of sync
+    views run on Django's shared thread and are not recorded, those of
+    `asyncViews.async_view` are.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            # same marker MiddlewareMixin sets, it tells the handler to await us
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if random.random() >= settings.METRICS_SAMPLE_RATE:
+            return self.count(request, self.get_response(request))
+        started = time.perf_counter()
+        with sampled_request() as queries, recording_queries():
+            response = self.get_response(request)
+        return self.record(request, response, queries, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        if random.random() >= settings.METRICS_SAMPLE_RATE:
+            return self.count(request, await self.get_response(request))
+        started = time.perf_counter()
+        with sampled_request() as queries:
+            response = await self.get_response(request)
+        return self.record(request, response, queries, time.perf_counter() - started)
+
+    def count(self, request, response):
+        metrics.inc('http_requests_total', route=route_of(request), method=request.method,
+                    status=response.status_code)
+        return response
+
+    def record(self, request, response, queries, duration):
+        route = route_of(request)
+        self.count(request, response)
+        metrics.observe('http_request_duration_seconds', duration, route=route, method=request.method)
+        metrics.inc('db_queries_total', queries.count, route=route)
+        metrics.inc('db_query_seconds_total', queries.duration, route=route)
+        return response
+
+
+def route_of(request):
+    # the url pattern, not the path, keeps the number of series bounded
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else 'unmatched'
+
+
+class TimedSerializerMixin:
+    """Record the time producing `.data` takes, labelled with the serializer's name."""
+
+    @property
+    def data(self):
+        with timer('serializer_seconds', serializer=type(getattr(self, 'child', self)).__name__):
+            return super().data
+
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    pass
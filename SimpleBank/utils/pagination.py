@@ -0,0 +1,171 @@
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .dbRouter import use_replica
+
+
+class ReportPagination(PageNumberPagination):
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+def seek(queryset, position=None, reverse=False):
+    """
+    Order `queryset` newest first on (created_at, id), oldest first when
+    `reverse`, and start it after `position`, a (created_at, id) pair.
+    """
+    # the redundant bound on created_at alone is what lets the database seek the index to the position
+    created_at, pk = position or (None, None)
+    if reverse:
+        queryset = queryset.order_by('created_at', 'id')
+        if position is not None:
+            queryset = queryset.filter(Q(created_at__gt=created_at) | Q(id__gt=pk), created_at__gte=created_at)
+    else:
+        queryset = queryset.order_by('-created_at', '-id')
+        if position is not None:
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(id__lt=pk), created_at__lte=created_at)
+    return queryset
+
+
+class KeysetHistory:
+    """
+    Rows matching any of `branches`, read page by page on the (created_at, id)
+    keyset. Every branch is a queryset one index serves in keyset order, so a
+    page costs one short range read per branch, whatever the size of the
+    table; an `OR` of the branches would scan and sort it instead. The rows
+    of a page are then loaded by id from `rows`.
+    """
+
+    def __init__(self, branches, rows):
+        self.branches = branches
+        self.rows = rows
+
+    def keys(self, position=None, size=50, reverse=False):
+        keys = set()
+        for branch in self.branches:
+            # a row several branches reach counts once
+            keys.update(seek(branch, position, reverse).values_list('created_at', 'id')[:size])
+        return sorted(keys, reverse=not reverse)[:size]
+
+    def page(self, position=None, size=50, reverse=False):
+        keys = self.keys(position, size, reverse)
+        rows = self.rows.in_bulk([pk for _, pk in keys])
+        return [rows[pk] for _, pk in keys]
+
+
+class TransactionCursorPagination(BasePagination):
+    """
+    Cursor pagination of a `KeysetHistory`, newest first. The cursor holds the
+    (created_at, id) key of the row to continue after, so paging never counts
+    or skips rows.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_history(self, history, request):
+        self.request = request
+        size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+        # one row more tells whether the walk goes on
+        page = history.page(position, size + 1, reverse)
+        more = len(page) > size
+        page = page[:size]
+        if reverse:
+            page.reverse()
+            self.has_next, self.has_previous = position is not None, more
+        else:
+            self.has_next, self.has_previous = more, position is not None
+        self.page = page
+        return page
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(request.query_params[self.page_size_query_param], strict=True,
+                                 cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            cursor = json.loads(b64decode(encoded.encode('ascii')).decode('ascii'))
+            position = (parse_datetime(cursor['created_at']), int(cursor['id']))
+            if position[0] is None:
+                raise ValueError(cursor['created_at'])
+            return position, bool(cursor.get('reverse'))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row, reverse):
+        cursor = {'created_at': row.created_at.isoformat(), 'id': row.id}
+        if reverse:
+            cursor['reverse'] = 1
+        encoded = b64encode(json.dumps(cursor).encode('ascii')).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+
+def keyset_batches(history, batch_size=1000):
+    """
+    Yield the rows of a `KeysetHistory` newest first in batches, seeking on
+    (created_at, id) instead of using OFFSET or a server-side cursor, so
+    every batch is an index range read and only one batch is held in memory.
+    """
+    batch = history.page(size=batch_size)
+    while batch:
+        yield batch
+        last = batch[-1]
+        batch = history.page((last.created_at, last.id), batch_size)
+
+
+def stream_ndjson(history, serializer_class, batch_size=1000):
+    encoder = JSONEncoder()
+
+    def rows():
+        batches = keyset_batches(history, batch_size)
+        while True:
+            # the body is produced after the view returned, outside its `use_replica`; the
+            # flag is only held while a batch is read, never across a yield
+            with use_replica():
+                batch = next(batches, None)
+                if batch is None:
+                    return
+                data = serializer_class(batch, many=True).data
+            for row in data:
+                yield encoder.encode(row) + '\n'
+
+    return StreamingHttpResponse(rows(), content_type='application/x-ndjson')
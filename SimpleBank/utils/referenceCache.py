@@ -0,0 +1,91 @@
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.serializers import PrimaryKeyRelatedField
+
+VERSION_KEY = 'reference:version'
+
+
+def version():
+    return cache.get_or_set(VERSION_KEY, 1, None)
+
+
+def bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
+
+
+class ReferenceCache:
+    """
+    Every `Branch` (with its `Bank`) and `Bank` kept in process memory. The
+    tables are reloaded whole whenever the shared version, bumped on every
+    save or delete of either model, moves on, and at the latest after
+    `REFERENCE_CACHE_TIMEOUT` seconds, since the version only reaches other
+    processes through a shared cache backend. A lookup otherwise costs one
+    cache read and no query. Callers get copies, so they may not alter the
+    cached instances.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.loaded_at = 0
+        self.tables = {'branch': {}, 'bank': {}}
+
+    def refresh(self, force=False):
+        current = version()
+        if not force and current == self.version \
+                and time.monotonic() - self.loaded_at < settings.REFERENCE_CACHE_TIMEOUT:
+            return
+        from manage.models import Bank, Branch
+        with self.lock:
+            self.tables = {
+                'branch': {branch.id: branch for branch in Branch.objects.select_related('bank')},
+                'bank': {bank.id: bank for bank in Bank.objects.all()},
+            }
+            self.version = current
+            self.loaded_at = time.monotonic()
+
+    def get(self, kind, pk):
+        self.refresh()
+        instance = self.tables[kind].get(pk)
+        return copy.copy(instance) if instance is not None else None
+
+    def branch(self, pk):
+        return self.get('branch', pk)
+
+    def bank(self, pk):
+        return self.get('bank', pk)
+
+
+references = ReferenceCache()
+
+
+class ReferenceField(PrimaryKeyRelatedField):
+    """
+    `PrimaryKeyRelatedField` that resolves the primary key of a `kind`
+    ('branch' or 'bank') through `references`. A miss falls back to the
+    field's queryset, and reloads the cache when the row exists after all.
+    """
+
+    def __init__(self, kind, **kwargs):
+        self.kind = kind
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        instance = references.get(self.kind, pk)
+        if instance is None:
+            instance = self.get_queryset().filter(pk=pk).first()
+            if instance is None:
+                self.fail('does_not_exist', pk_value=data)
+            references.refresh(force=True)
+        return instance
@@ -0,0 +1,110 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import IntegerField, Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from service.models import Account, Installment, Loan, JobCheckpoint
+from .batching import FALSE, id_chunks, id_range, Throughput
+from .smsService import manage_bulk_sms
+from .smsTemplates import related_fields
+from .statisticService import StatisticBuffer
+
+
+def settle_chunk(installments):
+    """
+    Settle a chunk of due installments in one transaction. Installments, their
+    loans and the debtors' accounts are loaded and row-locked with two queries
+    and written back with one statement per table. Returns the number of
+    settled installments and the ones that could not be paid.
+    """
+    installments = list(installments.select_for_update().select_related('loan', *related_fields('installment'))
+                        .order_by('pay_date', 'id'))
+    accounts = {}
+    for account in Account.objects.select_for_update() \
+            .filter(owner_id__in={installment.debtor_id for installment in installments}, is_active=True) \
+            .order_by('id'):
+        accounts.setdefault(account.owner_id, account)
+
+    loans = {}
+    statistics = StatisticBuffer()
+    charged_accounts = {}
+    settled = []
+    unpaid = []
+    for installment in installments:
+        account = accounts.get(installment.debtor_id)
+        if account is not None and account.credit > installment.amount:
+            account.credit = account.credit - installment.amount
+            charged_accounts[account.id] = account
+            loan = loans.setdefault(installment.loan_id, installment.loan)
+            loan.remainder_installment = loan.remainder_installment - installment.amount
+            if loan.open_installments is not None:
+                loan.open_installments = loan.open_installments - 1
+            statistics.add(installment.debtor_id, debt=-installment.amount, credit=-installment.amount)
+            settled.append(installment.id)
+        else:
+            unpaid.append(installment)
+
+    Installment.objects.filter(id__in=settled, is_settled=False).update(is_settled=True)
+    Account.objects.bulk_update(charged_accounts.values(), ['credit'])
+    Loan.objects.bulk_update(loans.values(), ['remainder_installment', 'open_installments'])
+    statistics.flush()
+    return len(settled), unpaid
+
+
+def settle_installments(code='calculate_installments', batch_size=None, lower=0, upper=None):
+    """
+    Settle every due installment whose debtor can afford it, chunk by chunk.
+    Debtors without enough credit get a reminder queued in the SMS outbox,
+    once per installment and day however often the job runs. `lower` and
+    `upper` limit the run to a shard of installment ids, whose progress is
+    checkpointed under `code` after every chunk.
+    """
+    batch_size = batch_size or int(settings.INSTALLMENT_BATCH_SIZE)
+    today = timezone.localdate()
+    throughput = Throughput(code)
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(code=code)
+    due_installments = id_range(Installment.objects.filter(pay_date__lt=timezone.now(), is_settled=FALSE),
+                                lower, upper)
+    for ids in id_chunks(due_installments, checkpoint.watermark, batch_size):
+        with transaction.atomic():
+            settled, unpaid = settle_chunk(due_installments.filter(id__in=ids))
+            unpaid = [installment for installment in unpaid if installment.reminded_on != today]
+            Installment.objects.filter(id__in=[installment.id for installment in unpaid]).update(reminded_on=today)
+            manage_bulk_sms([(None, installment, 'installment') for installment in unpaid])
+            checkpoint.watermark = ids[-1]
+            checkpoint.save(update_fields=['watermark', 'updated_at'])
+        throughput.add(settled)
+    # the shard is done, next run walks it from the start again
+    checkpoint.watermark = 0
+    checkpoint.save(update_fields=['watermark', 'updated_at'])
+    return throughput
+
+
+def backfill_open_installments(lower=0, upper=None):
+    # loans created before the counter existed get it computed once, in one statement
+    open_count = Installment.objects.filter(loan=OuterRef('pk'), is_settled=False) \
+        .values('loan').annotate(total=Count('id')).values('total')
+    id_range(Loan.objects.filter(is_settled=FALSE, open_installments__isnull=True), lower, upper) \
+        .update(open_installments=Coalesce(Subquery(open_count, output_field=IntegerField()), 0))
+
+
+def settle_loans(code='calculate_loans', lower=0, upper=None):
+    """
+    Mark loans whose last installment got paid as settled. The installment
+    settler keeps `Loan.open_installments` up to date, so this only touches
+    the loans that reached zero since the previous run.
+    """
+    throughput = Throughput(code)
+    backfill_open_installments(lower, upper)
+    with transaction.atomic():
+        finished = list(id_range(Loan.objects.select_for_update(), lower, upper)
+                        .filter(is_settled=FALSE, open_installments__lte=0)
+                        .values_list('id', 'applicant_id'))
+        if finished:
+            Loan.objects.filter(id__in=[pk for pk, _ in finished]).update(is_settled=True)
+            statistics = StatisticBuffer()
+            for _, applicant_id in finished:
+                statistics.add(applicant_id, loans_unsettled=-1)
+            statistics.flush()
+    throughput.add(len(finished))
+    return throughput
@@ -1,34 +1,75 @@
-from service.enums import TransactionType
-from SimpleBank.utils.celeryTasks import send_SMS
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from service.models import SmsOutbox
+from SimpleBank.utils.celeryTasks import send_SMS, dispatch_sms_outbox
+from SimpleBank.utils.smsTemplates import render
+
+
+def schedule_dispatch():
+    # at most one dispatcher task per SMS_DISPATCH_DELAY, however many messages were queued
+    delay = int(settings.SMS_DISPATCH_DELAY)
+    if cache.add('sms:dispatch:scheduled', True, delay):
+        dispatch_sms_outbox.apply_async(countdown=delay)
+
+
+def enqueue_sms(notifications):
+    """
+    Append notifications to the outbox. The rows join the caller's database
+    transaction, and the dispatcher is only woken up once it commits.
+    """
+    if not notifications:
+        return
+    SmsOutbox.objects.bulk_create([SmsOutbox(mobile=mobile, message=message) for mobile, message in notifications])
+    transaction.on_commit(schedule_dispatch)
 
 
 def manage_sms(user, model, type):
-    # we assume we all send this to mobile
-    message = "We all Love radkal2 <3"
-    if type == 'welcome':
-        message = 'Welcome to the Bonus Bank dear %s %s!' % (user.first_name, user.last_name)
-    elif type == 'account':
-        message = 'Dear %s %s, your account number is:\n%s' % (user.first_name, user.last_name, model.number)
-    elif type == 'transaction':
-        if model.type == TransactionType.WITHDRAW.value:
-            message = 'Dear %s %s, %d toman withdrawn from account number: %s' % \
-                      (user.first_name, user.last_name, model.amount, model.dest_account.number)
-        elif model.type == TransactionType.DEPOSIT_CASH.value:
-            message = 'Dear %s %s, %d toman deposited to account number: %s' % \
-                      (user.first_name, user.last_name, model.amount, model.dest_account.number)
-        elif model.type == TransactionType.DEPOSIT.value:
-            message = ['Dear %s %s, %d toman withdrawn from account number %s to account number %s' %
-                       (user.first_name, user.last_name, model.amount, model.dest_account.number,
-                        model.src_account.number),
-                       'Dear %s %s, %d toman deposited to account number %s' %
-                       (model.src_account.owner.first_name, model.src_account.owner.last_name,
-                        model.amount, model.src_account.number),
-                       ]
-    elif type == 'loan':
-        message = 'Dear %s %s, You got a bank loan amount: %d Toman with a %d-month repayment term.' % \
-                  (user.first_name, user.last_name, model.amount, int(model.type))
-    elif type == 'installment':
-        message = 'Dear %s %s, Your account has no enough credit to pay for installment %d Toman.' % \
-                  (model.debtor.first_name, model.debtor.last_name, model.amount)
-
-    send_SMS.delay(message)
+    enqueue_sms(render(type, user, model))
+
+
+def manage_bulk_sms(notifications):
+    """Queue a batch of `(user, model, type)` notifications with one insert."""
+    rows = []
+    for user, model, type in notifications:
+        rows.extend(render(type, user, model))
+    enqueue_sms(rows)
+
+
+def dispatch_outbox(batch_size=None):
+    """
+    Drain the outbox in chunks. Every chunk goes to the broker as a single
+    `send_SMS` task, with identical (mobile, message) pairs sent once.
+    """
+    batch_size = batch_size or int(settings.SMS_DISPATCH_BATCH_SIZE)
+    dispatched = 0
+    while True:
+        with transaction.atomic():
+            rows = list(SmsOutbox.objects.select_for_update().filter(is_sent=False).order_by('id')
+                        .values_list('id', 'mobile', 'message')[:batch_size])
+            if not rows:
+                return dispatched
+            messages = list(dict.fromkeys((mobile, message) for _, mobile, message in rows))
+            send_SMS.delay(messages)
+            SmsOutbox.objects.filter(id__in=[pk for pk, _, _ in rows]).update(is_sent=True, sent_at=timezone.now())
+        dispatched += len(rows)
+
+
+def purge_outbox(batch_size=None):
+    """
+    Delete the rows sent more than `SMS_OUTBOX_RETENTION_DAYS` ago, one short
+    `DELETE` per chunk, so the outbox only holds recent history and the
+    dispatcher's scans stay small.
+    """
+    batch_size = batch_size or int(settings.SMS_DISPATCH_BATCH_SIZE)
+    cutoff = timezone.now() - datetime.timedelta(days=int(settings.SMS_OUTBOX_RETENTION_DAYS))
+    purged = 0
+    while True:
+        ids = list(SmsOutbox.objects.filter(is_sent=True, sent_at__lt=cutoff).order_by('id')
+                   .values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return purged
+        purged += SmsOutbox.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,96 @@
+from collections import namedtuple
+from operator import attrgetter
+
+from service.enums import TransactionType
+
+SmsContext = namedtuple('SmsContext', ['user', 'model'])
+
+
+class SmsTemplate:
+    """
+    A message compiled once at import time.
+
+    `fields` are the dotted paths read off the `(user, model)` context to fill
+    the `%` placeholders, `recipient` is the path of the mobile the message
+    goes to and `related` lists the `select_related` paths the model needs for
+    rendering to stay in memory.
+    """
+
+    def __init__(self, text, fields, recipient, related=()):
+        self.text = text
+        self.getters = [attrgetter(field) for field in fields]
+        self.recipient = attrgetter(recipient)
+        self.related = tuple(related)
+
+    def render(self, context):
+        return self.recipient(context), self.text % tuple(getter(context) for getter in self.getters)
+
+
+TEMPLATES = {
+    'welcome': [
+        SmsTemplate('Welcome to the Bonus Bank dear %s %s!',
+                    ['user.first_name', 'user.last_name'], 'user.mobile'),
+    ],
+    'account': [
+        SmsTemplate('Dear %s %s, your account number is:\n%s',
+                    ['user.first_name', 'user.last_name', 'model.number'], 'user.mobile'),
+    ],
+    'transaction:' + TransactionType.WITHDRAW.value: [
+        SmsTemplate('Dear %s %s, %d toman withdrawn from account number: %s',
+                    ['user.first_name', 'user.last_name', 'model.amount', 'model.dest_account.number'],
+                    'user.mobile', related=['dest_account']),
+    ],
+    'transaction:' + TransactionType.DEPOSIT_CASH.value: [
+        SmsTemplate('Dear %s %s, %d toman deposited to account number: %s',
+                    ['user.first_name', 'user.last_name', 'model.amount', 'model.dest_account.number'],
+                    'user.mobile', related=['dest_account']),
+    ],
+    'transaction:' + TransactionType.DEPOSIT.value: [
+        SmsTemplate('Dear %s %s, %d toman withdrawn from account number %s to account number %s',
+                    ['user.first_name', 'user.last_name', 'model.amount', 'model.dest_account.number',
+                     'model.src_account.number'],
+                    'user.mobile', related=['dest_account', 'src_account']),
+        SmsTemplate('Dear %s %s, %d toman deposited to account number %s',
+                    ['model.src_account.owner.first_name', 'model.src_account.owner.last_name', 'model.amount',
+                     'model.src_account.number'],
+                    'model.src_account.owner.mobile', related=['src_account__owner']),
+    ],
+    'loan': [
+        SmsTemplate('Dear %s %s, You got a bank loan amount: %d Toman with a %s-month repayment term.',
+                    ['user.first_name', 'user.last_name', 'model.amount', 'model.type'], 'user.mobile'),
+    ],
+    'installment': [
+        SmsTemplate('Dear %s %s, Your account has no enough credit to pay for installment %d Toman.',
+                    ['model.debtor.first_name', 'model.debtor.last_name', 'model.amount'],
+                    'model.debtor.mobile', related=['debtor']),
+    ],
+}
+
+
+def event_key(type, model):
+    # transactions have one set of templates per transaction type
+    if type == 'transaction':
+        return 'transaction:' + model.type
+    return type
+
+
+def related_fields(type):
+    """
+    The `select_related` paths needed to render any message of `type`, e.g.
+    `related_fields('transaction')` covers every transaction type.
+    """
+    related = []
+    for key, templates in TEMPLATES.items():
+        if key == type or key.startswith(type + ':'):
+            for template in templates:
+                related.extend(field for field in template.related if field not in related)
+    return related
+
+
+def render(type, user, model):
+    """Return the `(mobile, message)` pairs an event sends, without touching the database."""
+    context = SmsContext(user, model)
+    templates = TEMPLATES.get(event_key(type, model))
+    if templates is None:
+        return [(user.mobile, "We all Love radkal2 <3")]
+    return [template.render(context) for template in templates]
@@ -0,0 +1,100 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Sum, Count, Exists, OuterRef, Subquery, IntegerField
+from django.db.models.functions import Coalesce
+from identity.models import UserStatistic
+from service.models import Account, Loan, Installment
+from .batching import id_chunks, KeyedCase
+
+# `credit` is the sum of the user's active account balances, every balance change
+# has to come with the same delta here
+COUNTERS = ('credit', 'debt', 'loans_gotten', 'loans_unsettled')
+VERSION_KEY = 'statistic:version'
+
+
+def version():
+    return cache.get_or_set(VERSION_KEY, 1, None)
+
+
+def bump_version():
+    # every write moves the version on, which retires all cached statistic listings at once
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
+
+
+def apply_deltas(user_id, **deltas):
+    """Add `deltas` to one user's counters with a single `UPDATE ... SET x = x + ?`."""
+    deltas = {field: amount for field, amount in deltas.items() if amount}
+    if deltas:
+        UserStatistic.objects.filter(user_id=user_id).update(**{field: F(field) + amount
+                                                                for field, amount in deltas.items()})
+        bump_version()
+
+
+def set_values(user_id, **values):
+    UserStatistic.objects.filter(user_id=user_id).update(**values)
+    bump_version()
+
+
+class StatisticBuffer:
+    """
+    Collects counter deltas for many users and writes all of them with one
+    `UPDATE` per flush, each counter becoming `x = x + CASE user_id ... END`.
+    Meant for the batch jobs, which flush once per chunk inside the chunk's
+    transaction.
+    """
+
+    def __init__(self):
+        self.deltas = defaultdict(lambda: defaultdict(int))
+
+    def add(self, user_id, **deltas):
+        for field, amount in deltas.items():
+            self.deltas[user_id][field] += amount
+
+    def flush(self):
+        deltas = {user_id: {field: amount for field, amount in fields.items() if amount}
+                  for user_id, fields in self.deltas.items()}
+        deltas = {user_id: fields for user_id, fields in deltas.items() if fields}
+        self.deltas.clear()
+        if len(deltas) == 1:
+            apply_deltas(*deltas.keys(), **next(iter(deltas.values())))
+            return
+        updates = {}
+        for field in COUNTERS:
+            amounts = {user_id: fields[field] for user_id, fields in deltas.items() if field in fields}
+            if amounts:
+                updates[field] = F(field) + KeyedCase('user_id', amounts)
+        if updates:
+            UserStatistic.objects.filter(user_id__in=list(deltas)).update(**updates)
+            bump_version()
+
+
+def total(queryset, user_field, aggregate):
+    # correlated `SELECT aggregate ... WHERE user_field = statistic.user_id`, 0 when there are no rows
+    rows = queryset.filter(**{user_field: OuterRef('user')}).values(user_field).annotate(total=aggregate)
+    return Coalesce(Subquery(rows.values('total'), output_field=IntegerField()), 0)
+
+
+def reconcile(batch_size=None):
+    """
+    Rebuild every statistic from the source tables, one `UPDATE` of
+    correlated subqueries per chunk of users. Returns the number of
+    statistics rebuilt.
+    """
+    batch_size = batch_size or int(settings.STATISTIC_RECONCILE_BATCH_SIZE)
+    values = {
+        'credit': total(Account.objects.filter(is_active=True), 'owner', Sum('credit')),
+        'debt': total(Installment.objects.filter(is_settled=False), 'debtor', Sum('amount')),
+        'loans_gotten': total(Loan.objects.all(), 'applicant', Count('id')),
+        'loans_unsettled': total(Loan.objects.filter(is_settled=False), 'applicant', Count('id')),
+        'account_closed': Exists(Account.objects.filter(owner=OuterRef('user'), is_active=False)),
+    }
+    reconciled = 0
+    for ids in id_chunks(UserStatistic.objects.all(), 0, batch_size):
+        reconciled += UserStatistic.objects.filter(id__in=ids).update(**values)
+    bump_version()
+    return reconciled
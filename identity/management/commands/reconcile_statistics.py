@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from SimpleBank.utils.statisticService import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Rebuild every user statistic from accounts, loans and installments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        reconciled = reconcile(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('%d user statistics reconciled.' % reconciled))
@@ -63,7 +63,10 @@ class User(AbstractBaseUser, PermissionsMixin):
         dt = datetime.now() + timedelta(days=60)
 
         return jwt.encode({
+            'id': self.id,
             'mobile': self.mobile,
+            'role': self.role,
+            'is_staff': self.is_staff,
             'exp': int(dt.strftime('%s'))
         }, settings.SECRET_KEY, algorithm='HS256')
 
@@ -81,5 +84,15 @@ class UserStatistic(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, blank=True, null=True)
     updated_at = models.DateTimeField(auto_now=True, blank=True, null=True)
 
+    # one per admin ordering of UserStatisticListView
+    class Meta:
+        indexes = [
+            models.Index(fields=['credit']),
+            models.Index(fields=['debt']),
+            models.Index(fields=['account_closed']),
+            models.Index(fields=['loans_gotten']),
+            models.Index(fields=['loans_unsettled']),
+        ]
+
     def __str__(self):
         return self.name
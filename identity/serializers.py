@@ -2,6 +2,8 @@ from rest_framework import serializers
 from .models import User, UserStatistic
 from django.contrib.auth import authenticate
 from SimpleBank.utils import exceptions
+from SimpleBank.utils import statisticService as statistics
+from SimpleBank.utils.metrics import TimedSerializerMixin, TimedListSerializer
 from django.conf import settings
 from .enums import RoleType
 from rest_framework.serializers import PrimaryKeyRelatedField
@@ -12,11 +14,12 @@ import datetime
 from dateutil.relativedelta import relativedelta
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     first_name = serializers.CharField(max_length=32, min_length=2)
     last_name = serializers.CharField(max_length=32, min_length=2)
 
     class Meta:
+        list_serializer_class = TimedListSerializer
         model = User
         fields = ('id', 'mobile', 'first_name', 'last_name')
         read_only_fields = ('mobile', 'id')
@@ -24,16 +27,16 @@ class UserSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         for (key, value) in validated_data.items():
             setattr(instance, key, value)
-        instance.save()
-        user_statistic = UserStatistic.objects.get(user=instance)
-        user_statistic.name = instance.first_name + ' ' + instance.last_name
-        user_statistic.save()
+        # `instance` may come from the auth cache, only the edited columns are written back
+        instance.save(update_fields=[*validated_data, 'updated_at'])
+        statistics.set_values(instance.id, name=instance.first_name + ' ' + instance.last_name)
         return instance
 
 
-class UserStatisticSerializer(serializers.ModelSerializer):
+class UserStatisticSerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
+        list_serializer_class = TimedListSerializer
         model = UserStatistic
         fields = ['name', 'mobile', 'credit', 'debt', 'account_closed', 'loans_gotten', 'loans_unsettled']
 
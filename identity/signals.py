@@ -0,0 +1,17 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import User, UserStatistic
+from SimpleBank.utils.backends import forget_user
+from SimpleBank.utils.statisticService import bump_version
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache(sender, instance, **kwargs):
+    forget_user(instance.mobile)
+
+
+@receiver(post_save, sender=UserStatistic)
+@receiver(post_delete, sender=UserStatistic)
+def invalidate_statistic_listings(sender, instance, **kwargs):
+    bump_version()
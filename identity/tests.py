@@ -1,3 +1,70 @@
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from identity.enums import RoleType
+from identity.models import User, UserStatistic
+from SimpleBank.utils.statisticService import apply_deltas
+
+
+class UserUpdateTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('9121111111', 'password123')
+        UserStatistic.objects.create(user=self.user, mobile=self.user.mobile)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.user.token)
+
+    def test_update_keeps_columns_changed_behind_the_cached_user(self):
+        # the first request puts the user into the auth cache
+        self.assertEqual(self.client.get('/api/user/').status_code, 200)
+        # queryset updates send no signal, the cached copy goes stale
+        User.objects.filter(pk=self.user.pk).update(role=RoleType.BRANCH_MANAGER.value, is_staff=True,
+                                                     password='changed')
+
+        response = self.client.patch('/api/user/', {'first_name': 'Ali'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.first_name, 'Ali')
+        self.assertEqual((user.role, user.is_staff, user.password), (RoleType.BRANCH_MANAGER.value, True, 'changed'))
+        self.assertEqual(UserStatistic.objects.get(user=user).name, 'Ali ')
+
+
+class UserStatisticListTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_user('9120000000', 'password123')
+        self.staff.is_staff = True
+        self.staff.save()
+        UserStatistic.objects.create(user=self.staff, mobile=self.staff.mobile)
+        self.users = [User.objects.create_user('912111111%d' % i, 'password123') for i in range(5)]
+        for i, user in enumerate(self.users):
+            UserStatistic.objects.create(user=user, mobile=user.mobile, credit=(i + 1) * 1000)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.staff.token)
+        self.url = '/api/user/statistic?ordering=-credit&page_size=2'
+
+    def test_pages_walk_the_ordering(self):
+        mobiles, url = [], self.url
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(response.data['count'], 6)
+            mobiles += [row['mobile'] for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(mobiles, [user.mobile for user in reversed(self.users)] + [self.staff.mobile])
+
+    def test_identical_request_is_served_from_cache(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200, first.content)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second.data, first.data)
+
+    def test_statistic_write_reloads_the_listing(self):
+        self.assertEqual(self.client.get(self.url).data['results'][0]['credit'], 5000)
+        apply_deltas(self.users[0].id, credit=10000)
+        row = self.client.get(self.url).data['results'][0]
+        self.assertEqual((row['mobile'], row['credit']), (self.users[0].mobile, 11000))
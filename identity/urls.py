@@ -1,14 +1,21 @@
+from django.conf import settings
 from django.urls import path, include, re_path
 from .views import (
     LoginAPIView, RegistrationAPIView, UserRetrieveUpdateAPIView, StaffViewSet, UserStatisticListView
 )
 from rest_framework import routers
+from SimpleBank.utils.asyncViews import async_view
 
 router = routers.DefaultRouter(trailing_slash=False)
 router.register(r'staff', StaffViewSet, basename='staff')
 
+if settings.ASYNC_READ_VIEWS:
+    user_view = async_view(UserRetrieveUpdateAPIView.as_view())
+else:
+    user_view = UserRetrieveUpdateAPIView.as_view()
+
 urlpatterns = [
-    path('', UserRetrieveUpdateAPIView.as_view()),
+    path('', user_view),
     path('statistic', UserStatisticListView.as_view()),
     path('register', RegistrationAPIView.as_view()),
     path('login', LoginAPIView.as_view()),
@@ -1,4 +1,8 @@
+import hashlib
+
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from rest_framework.generics import RetrieveUpdateAPIView
 from .models import User, UserStatistic
 from django.shortcuts import get_object_or_404
@@ -12,18 +16,34 @@ from rest_framework import viewsets
 from SimpleBank.utils.bonusRenderer import BonusResponseRenderer
 from .enums import RoleType
 from SimpleBank.utils.smsService import manage_sms
+from SimpleBank.utils.pagination import ReportPagination
+from SimpleBank.utils import statisticService as statistics
+from SimpleBank.utils.dbRouter import use_replica
 from rest_framework.filters import OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend, FilterSet
 
 
 class UserStatisticListView(generics.ListAPIView):
     permission_classes = [IsAdminUser]
-    queryset = UserStatistic.objects.all()
+    queryset = UserStatistic.objects.order_by('id')
     serializer_class = UserStatisticSerializer
+    pagination_class = ReportPagination
     filter_backends = (DjangoFilterBackend, OrderingFilter, )
     filterset_fields = ['name', 'mobile', 'credit', 'debt', 'account_closed', 'loans_gotten', 'loans_unsettled']
     ordering_fields = ['credit', 'debt', 'account_closed', 'loans_gotten', 'loans_unsettled']
 
+    # dashboards poll the same few queries, serve them from cache until any statistic changes
+    def list(self, request, *args, **kwargs):
+        path = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+        key = 'statistic:list:%s:%s' % (statistics.version(), path)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data, status=status.HTTP_200_OK)
+        with use_replica():
+            response = super().list(request, *args, **kwargs)
+        cache.set(key, response.data, settings.STATISTIC_LIST_CACHE_TIMEOUT)
+        return response
+
 
 class StaffViewSet(viewsets.ViewSet):
     permission_classes = (IsAdminUser,)
@@ -84,11 +104,12 @@ class RegistrationAPIView(APIView):
 
         serializer = self.serializer_class(data=user)
         if serializer.is_valid():
-            serializer.save()
-            user = User.objects.get(pk=serializer.data['id'])
-            user_statistic = UserStatistic(user=user, mobile=user.mobile, name=user.first_name+' '+user.last_name)
-            user_statistic.save()
-            manage_sms(user, None, 'welcome')
+            with transaction.atomic():
+                serializer.save()
+                user = User.objects.get(pk=serializer.data['id'])
+                user_statistic = UserStatistic(user=user, mobile=user.mobile, name=user.first_name+' '+user.last_name)
+                user_statistic.save()
+                manage_sms(user, None, 'welcome')
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         else:
             response['detail'] = serializer.errors
@@ -4,6 +4,7 @@ from identity.serializers import UserSerializer
 from identity.models import User
 from identity.enums import RoleType
 from SimpleBank.utils import exceptions
+from SimpleBank.utils.referenceCache import ReferenceField
 from django.conf import settings
 from rest_framework.serializers import PrimaryKeyRelatedField
 import random
@@ -36,7 +37,7 @@ class BranchMinimalSerializer(serializers.ModelSerializer):
 
 class BranchCreateSerializer(serializers.ModelSerializer):
     name = serializers.CharField(max_length=32, min_length=2)
-    bank_id = PrimaryKeyRelatedField(queryset=Bank.objects.all(), required=True)
+    bank_id = ReferenceField('bank', queryset=Bank.objects.all(), required=True)
     manager_id = PrimaryKeyRelatedField(queryset=User.objects.filter(role=RoleType.BRANCH_MANAGER.value),
                                         required=True)
 
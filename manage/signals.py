@@ -0,0 +1,12 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Bank, Branch
+from SimpleBank.utils.referenceCache import bump_version
+
+
+@receiver(post_save, sender=Bank)
+@receiver(post_delete, sender=Bank)
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+def invalidate_reference_cache(sender, instance, **kwargs):
+    bump_version()
@@ -0,0 +1,67 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test import Client
+from django.test.utils import override_settings
+from identity.models import User, UserStatistic
+
+MOBILE = '9100000000'
+PASSWORD = 'benchmark123'
+
+
+def request_timings(count, max_age, health_checks, user):
+    """
+    Time `count` logins and account listings of `user` through the whole
+    middleware and view stack. The test client leaves out the request
+    signals closing obsolete connections, so they are sent around every
+    request as the WSGI handler does. Returns the sorted durations in
+    seconds of each endpoint.
+    """
+    connection.close()
+    connection.settings_dict['CONN_MAX_AGE'] = max_age
+    # the middleware is loaded on the first request of a client, after the override
+    with override_settings(DB_CONN_HEALTH_CHECKS=health_checks, ALLOWED_HOSTS=['testserver']):
+        client = Client()
+        requests = {
+            '/api/user/login': lambda: client.post('/api/user/login', {'mobile': MOBILE, 'password': PASSWORD},
+                                                   content_type='application/json'),
+            '/api/service/account': lambda: client.get('/api/service/account',
+                                                       HTTP_AUTHORIZATION='Token ' + user.token),
+        }
+        timings = {path: [] for path in requests}
+        for _ in range(count):
+            for path, request in requests.items():
+                started = time.perf_counter()
+                close_old_connections()
+                response = request()
+                close_old_connections()
+                timings[path].append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise CommandError('%s answered %d: %s' % (path, response.status_code, response.content[:200]))
+    connection.close()
+    return {path: sorted(durations) for path, durations in timings.items()}
+
+
+class Command(BaseCommand):
+    help = 'Compare login and account list latency with a connection per request and with the DB_PROFILE settings.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+
+    def handle(self, *args, **options):
+        configured = connection.settings_dict['CONN_MAX_AGE']
+        modes = [('per request', 0, False),
+                 ('%s profile' % settings.DB_PROFILE, configured, settings.DB_CONN_HEALTH_CHECKS)]
+        user = User.objects.create_user(MOBILE, PASSWORD)
+        UserStatistic.objects.create(user=user, mobile=user.mobile)
+        try:
+            for name, max_age, health_checks in modes:
+                for path, timings in request_timings(options['requests'], max_age, health_checks, user).items():
+                    self.stdout.write('%-16s %-22s %d requests: p50 %.2fms, p99 %.2fms' % (
+                        name, path, len(timings), timings[len(timings) // 2] * 1000,
+                        timings[min(len(timings) - 1, len(timings) * 99 // 100)] * 1000))
+        finally:
+            connection.settings_dict['CONN_MAX_AGE'] = configured
+            user.delete()
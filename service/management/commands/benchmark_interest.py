@@ -0,0 +1,72 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from identity.models import User, UserStatistic
+from manage.models import Bank, Branch
+from service.models import Account
+from SimpleBank.utils.interestEngine import accrue_interest
+
+
+def seed_accounts(count, batch_size=10000):
+    """
+    Bulk-create `count` active accounts, one owner per ten accounts, in a
+    branch of their own. Returns the (lower, upper] id shard holding them.
+    """
+    owners = User.objects.bulk_create([User(mobile='+98919%07d' % i) for i in range(max(1, count // 10) + 2)],
+                                      batch_size=batch_size)
+    if owners[0].pk is None:
+        # backends that do not return the ids of a bulk insert
+        owners = list(User.objects.filter(mobile__startswith='+98919').order_by('id'))
+    UserStatistic.objects.bulk_create([UserStatistic(user=owner, mobile=owner.mobile) for owner in owners],
+                                      batch_size=batch_size)
+    bank = Bank.objects.create(name='Benchmark', owner=owners[0])
+    branch = Branch.objects.create(name='Benchmark branch', bank=bank, manager=owners[1])
+    customers = owners[2:]
+    lower = Account.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    for start in range(0, count, batch_size):
+        Account.objects.bulk_create([Account(number='9%015d' % i, owner=customers[i % len(customers)],
+                                             src_branch=branch, credit=1000000 + i)
+                                     for i in range(start, min(count, start + batch_size))])
+    return lower, Account.objects.order_by('-id').values_list('id', flat=True).first()
+
+
+def legacy_accrual(accounts):
+    # the per-account save loop CalculateDailyInterest ran before the interest engine
+    daily_percent = settings.YEARLY_INTEREST_PERCENT
+    for account in accounts:
+        interest = round(account.credit * daily_percent / 100 / 365)
+        account.credit = account.credit + interest
+        user_statistic = UserStatistic.objects.get(user=account.owner)
+        user_statistic.credit = account.credit
+        user_statistic.save()
+        account.save()
+
+
+class Command(BaseCommand):
+    help = 'Compare accrue_interest with the old per-account save loop on bulk-created accounts, then roll back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=1000000)
+        parser.add_argument('--baseline', type=int, default=10000,
+                            help='accounts the old loop runs on, its rate is measured on this sample')
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        # nothing of the run is kept; reads inside the transaction stay on the primary
+        with transaction.atomic():
+            lower, upper = seed_accounts(options['accounts'])
+            sample = Account.objects.filter(id__gt=lower).select_related('owner').order_by('id')
+            baseline = list(sample[:options['baseline']])
+            started = time.perf_counter()
+            legacy_accrual(baseline)
+            legacy_rate = len(baseline) / (time.perf_counter() - started)
+            self.stdout.write('save loop %d accounts: %.0f accounts/sec' % (len(baseline), legacy_rate))
+
+            started = time.perf_counter()
+            throughput = accrue_interest('benchmark_interest', options['batch_size'], lower=lower, upper=upper)
+            engine_rate = throughput.rows / (time.perf_counter() - started)
+            self.stdout.write('engine    %d accounts: %.0f accounts/sec, %.1fx the save loop' % (
+                throughput.rows, engine_rate, engine_rate / legacy_rate))
+            transaction.set_rollback(True)
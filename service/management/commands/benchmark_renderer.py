@@ -0,0 +1,46 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from identity.models import User
+from service.models import Account, Transaction
+from service.serializers import TransactionSerializer
+from SimpleBank.utils.bonusRenderer import BonusResponseRenderer, fast_dumps, std_dumps, orjson
+
+
+def transaction_rows(count):
+    # unsaved instances, serializing them needs no database
+    owners = [User(id=i, mobile='+98912%07d' % i, first_name='first', last_name='last') for i in range(1, 101)]
+    accounts = [Account(id=i, number='6%015d' % i, owner=owners[i % 100]) for i in range(1, 201)]
+    transactions = [Transaction(id=i, owner=owners[i % 100], src_account=accounts[i % 200],
+                                dest_account=accounts[(i + 1) % 200], amount=1000 + i, type='DEPOSIT')
+                    for i in range(1, count + 1)]
+    return TransactionSerializer(transactions, many=True).data
+
+
+class Command(BaseCommand):
+    help = 'Time BonusResponseRenderer with the stdlib and the orjson encoder on a transaction list.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        data = transaction_rows(options['rows'])
+        encoders = [('json', std_dumps)]
+        if orjson is not None:
+            encoders.append(('orjson', fast_dumps))
+        outputs = {}
+        for name, dumps in encoders:
+            renderer = BonusResponseRenderer()
+            renderer.dumps = dumps
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                outputs[name] = renderer.render(data)
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            self.stdout.write('%-6s %d rows: best %.1fms, median %.1fms, %d bytes' % (
+                name, options['rows'], timings[0] * 1000, timings[len(timings) // 2] * 1000, len(outputs[name])))
+        if len({json.dumps(json.loads(output)) for output in outputs.values()}) != 1:
+            self.stderr.write(self.style.ERROR('The encoders disagree on the rendered envelope.'))
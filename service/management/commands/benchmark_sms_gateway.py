@@ -0,0 +1,74 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from SimpleBank.utils.celeryTasks import send_SMS
+
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    # keep-alive, as the gateway session of every pool thread expects
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.received += len(body['messages'])
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_gateway(latency):
+    """A stand-in SMS gateway on a free local port, answering every batch after `latency` seconds."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), GatewayHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.lock = threading.Lock()
+    server.received = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def send_batches(batches, pool_size):
+    # what the threaded notifier does with `pool_size` threads: run send_SMS tasks side by side
+    with ThreadPoolExecutor(max_workers=pool_size) as pool:
+        for _ in pool.map(send_SMS, batches):
+            pass
+
+
+class Command(BaseCommand):
+    help = 'Measure send_SMS throughput against a local stand-in gateway for several notifier pool sizes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=5000)
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--latency', type=float, default=0.05, help='gateway answer time in seconds')
+        parser.add_argument('--pools', default='1,4,16,32')
+
+    def handle(self, *args, **options):
+        messages = [['+98912%07d' % i, 'message %d' % i] for i in range(options['messages'])]
+        size = options['batch_size']
+        batches = [messages[start:start + size] for start in range(0, len(messages), size)]
+        server = start_gateway(options['latency'])
+        try:
+            with override_settings(SMS_GATEWAY_URL='http://127.0.0.1:%d/send' % server.server_address[1]):
+                for pool_size in [int(pool) for pool in options['pools'].split(',')]:
+                    server.received = 0
+                    started = time.perf_counter()
+                    send_batches(batches, pool_size)
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write('pool %-3d %d messages in %d batches: %.0f messages/sec' % (
+                        pool_size, server.received, len(batches), server.received / elapsed))
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,51 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+from identity.models import User
+from service.enums import RepaymentType
+from service.serializers import LoanCreateSerializer
+from SimpleBank.utils.loanService import originate_loans
+
+
+def read_applications(rows):
+    """
+    Validate the rows of a loan import the way the loan endpoint validates a
+    request and return them as `originate_loans` applications. Raises
+    `CommandError` listing every bad row, so an import is checked whole
+    before anything is granted.
+    """
+    rows = list(rows)
+    users = User.objects.in_bulk({User.objects.normalize_mobile(row.get('mobile') or '') for row in rows},
+                                 field_name='mobile')
+    terms = {repayment.value for repayment in RepaymentType}
+    applications, errors = [], []
+    for line, row in enumerate(rows, start=2):
+        applicant = users.get(User.objects.normalize_mobile(row.get('mobile') or ''))
+        serializer = LoanCreateSerializer(data=row, context={'applicant': applicant})
+        if applicant is None:
+            errors.append('line %d: no user with mobile %s' % (line, row.get('mobile')))
+        elif row.get('type') not in terms:
+            errors.append('line %d: type must be one of %s' % (line, ', '.join(sorted(terms))))
+        elif not serializer.is_valid():
+            errors.append('line %d: %s' % (line, '; '.join('%s: %s' % (field, ' '.join(messages))
+                                                           for field, messages in serializer.errors.items())))
+        else:
+            applications.append(serializer.validated_data)
+    if errors:
+        raise CommandError('\n'.join(errors))
+    return applications
+
+
+class Command(BaseCommand):
+    help = 'Grant the loans of a CSV file with mobile, branch_id, amount and type columns, e.g. a branch promotion.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        with open(options['path'], newline='') as file:
+            applications = read_applications(csv.DictReader(file))
+        loans = originate_loans(applications, options['batch_size'])
+        self.stdout.write('Granted %d of %d loans, applicants without an active account were skipped.' % (
+            len(loans), len(applications)))
@@ -7,7 +7,8 @@ from manage.models import Branch
 
 
 class Account(models.Model):
-    number = models.CharField(max_length=16, default='1111111111111111', unique=True, blank=False)
+    # allocated by AccountCreateSerializer, see SimpleBank.utils.accountNumber
+    number = models.CharField(max_length=16, unique=True, blank=False)
     owner = models.ForeignKey(User, on_delete=models.PROTECT)
     src_branch = models.ForeignKey(Branch, on_delete=models.PROTECT)
     credit = models.IntegerField(default=0)
@@ -15,10 +16,22 @@ class Account(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, blank=True, null=True)
     updated_at = models.DateTimeField(auto_now=True, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner', 'is_active']),
+        ]
+
     def __str__(self):
         return self.owner
 
 
+class AccountNumberBlock(models.Model):
+    created_at = models.DateTimeField(auto_now_add=True, blank=True, null=True)
+
+    def __str__(self):
+        return str(self.id)
+
+
 class Transaction(models.Model):
     owner = models.ForeignKey(User, on_delete=models.PROTECT, default=1)
     src_account = models.ForeignKey(Account, related_name="src_accounts", on_delete=models.PROTECT, null=True)
@@ -28,6 +41,13 @@ class Transaction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, blank=True, null=True)
     updated_at = models.DateTimeField(auto_now=True, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # the history of an account, in keyset order
+            models.Index(fields=['dest_account', 'created_at', 'id']),
+            models.Index(fields=['src_account', 'created_at', 'id']),
+        ]
+
     def __str__(self):
         return self.owner
 
@@ -38,10 +58,18 @@ class Loan(models.Model):
     amount = models.IntegerField(default=0, blank=False)
     is_settled = models.BooleanField(default=False)
     remainder_installment = models.IntegerField(default=0, blank=False)
+    # maintained by the installment settler, null until backfilled for old loans
+    open_installments = models.IntegerField(blank=True, null=True)
     type = models.CharField(max_length=2, choices=[(r, r.value) for r in RepaymentType])
     created_at = models.DateTimeField(auto_now_add=True, blank=True, null=True)
     updated_at = models.DateTimeField(auto_now=True, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['applicant', 'is_settled']),
+            models.Index(fields=['is_settled', 'open_installments']),
+        ]
+
     def __str__(self):
         return self.applicant
 
@@ -52,7 +80,73 @@ class Installment(models.Model):
     amount = models.IntegerField(default=0)
     is_settled = models.BooleanField(default=False)
     pay_date = models.DateTimeField(default=timezone.now, blank=False, null=False)
+    # business date of the last unpaid reminder, debtors get at most one a day
+    reminded_on = models.DateField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_settled', 'pay_date']),
+        ]
+
     def __str__(self):
         return self.debtor
+
+
+class JobCheckpoint(models.Model):
+    code = models.CharField(max_length=64, unique=True, null=False)
+    watermark = models.BigIntegerField(default=0)
+    business_date = models.DateField(blank=True, null=True)
+    is_completed = models.BooleanField(default=False)
+    lock_token = models.CharField(max_length=32, default='', blank=True)
+    locked_until = models.DateTimeField(blank=True, null=True)
+    last_rows = models.BigIntegerField(default=0)
+    last_duration = models.FloatField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, blank=True, null=True)
+
+    def __str__(self):
+        return self.code
+
+
+class InterestAccrual(models.Model):
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name="interest_accruals")
+    business_date = models.DateField(blank=False, null=False)
+    amount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, blank=True, null=True)
+
+    class Meta:
+        unique_together = ('account', 'business_date')
+
+    def __str__(self):
+        return '%s %s' % (self.account_id, self.business_date)
+
+
+class DailyTransactionUsage(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="daily_usages")
+    date = models.DateField(blank=False, null=False)
+    amount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, blank=True, null=True)
+
+    class Meta:
+        unique_together = ('user', 'date')
+
+    def __str__(self):
+        return '%s %s' % (self.user_id, self.date)
+
+
+class SmsOutbox(models.Model):
+    mobile = models.CharField(max_length=13, blank=True, null=True)
+    message = models.TextField(blank=False)
+    is_sent = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True, blank=True, null=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_sent', 'id']),
+        ]
+
+    def __str__(self):
+        return '%s %s' % (self.mobile, self.message)
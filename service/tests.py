@@ -1,3 +1,892 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, OperationalError, connection, connections, transaction
+from django.db.models import F, Q, Sum
+from django.test.utils import CaptureQueriesContext
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.urls import path
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+
+from identity.enums import RoleType
+from identity.models import User, UserStatistic
+from manage.models import Bank, Branch
+from SimpleBank.utils.bonusRenderer import BonusResponseRenderer, fast_dumps, std_dumps, orjson
+from SimpleBank.utils.asyncViews import async_view
+from SimpleBank.utils.referenceCache import references
+from .management.commands.benchmark_renderer import transaction_rows
+from SimpleBank.utils.accountNumber import allocator
+from SimpleBank.utils.batching import FALSE, id_range
+from SimpleBank.cronTasks import JOBS
+from SimpleBank.utils import exceptions
+from SimpleBank.utils.celeryTasks import run_job_shard, run_periodic_job
+from SimpleBank.utils.dbRouter import REPLICA, use_replica
+from SimpleBank.utils.interestEngine import accrue_chunk, accrue_interest
+from SimpleBank.utils.jobLock import acquire_job_lock
+from SimpleBank.utils.loanService import originate_loan
+from SimpleBank.utils.settlementEngine import settle_installments
+from SimpleBank.utils.statisticService import StatisticBuffer, reconcile
+from SimpleBank.utils.smsService import dispatch_outbox, enqueue_sms, manage_sms, purge_outbox
+from SimpleBank.utils.ledgerService import post_transaction
+from .enums import TransactionType
+from .models import Account, AccountNumberBlock, DailyTransactionUsage, Installment, InterestAccrual, JobCheckpoint, \
+    Loan, SmsOutbox, Transaction
+from .views import AccountViewSet
+
+# the account list served both ways, for the load test
+urlpatterns = [
+    path('sync/account', AccountViewSet.as_view({'get': 'list'})),
+    path('async/account', async_view(AccountViewSet.as_view({'get': 'list'}))),
+]
+
+
+class BankFixture:
+    """Users, a bank with two branches and an authenticated API client."""
+
+    def create_user(self, mobile, role=RoleType.USER.value, is_staff=False):
+        user = User.objects.create_user(mobile, 'password123')
+        user.role = role
+        user.is_staff = is_staff
+        user.save()
+        UserStatistic.objects.create(user=user, mobile=user.mobile)
+        return user
+
+    def create_bank(self):
+        self.owner = self.create_user('9120000000', RoleType.BANK_OWNER.value, is_staff=True)
+        self.bank = Bank.objects.create(name='Bonus', owner=self.owner)
+        self.branch = Branch.objects.create(name='Branch #1', bank=self.bank,
+                                            manager=self.create_user('9120000001', RoleType.BRANCH_MANAGER.value))
+        self.other_branch = Branch.objects.create(name='Branch #2', bank=self.bank,
+                                                  manager=self.create_user('9120000002',
+                                                                           RoleType.BRANCH_MANAGER.value))
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + user.token)
+        return client
+
+
+class ReferenceFieldTests(BankFixture, TestCase):
+
+    def setUp(self):
+        self.create_bank()
+        self.user = self.create_user('9121111111')
+        self.client = self.client_for(self.user)
+
+    def test_account_requests_resolve_branches(self):
+        response = self.client.post('/api/service/account', {'src_branch_id': self.branch.id}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(Account.objects.get(owner=self.user).src_branch_id, self.branch.id)
+
+        response = self.client.delete('/api/service/account/close', {'src_branch_id': self.other_branch.id},
+                                      format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertFalse(Account.objects.get(owner=self.user).is_active)
+
+    def test_loan_request_resolves_branch(self):
+        Account.objects.create(number='6000000000000001', owner=self.user, src_branch=self.branch)
+        response = self.client.post('/api/service/loan', {'branch_id': self.branch.id, 'amount': 1200000,
+                                                          'type': '12'}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(Loan.objects.get(applicant=self.user).branch_id, self.branch.id)
+
+    def test_branch_request_resolves_bank(self):
+        manager = self.create_user('9120000003', RoleType.BRANCH_MANAGER.value)
+        response = self.client_for(self.owner).post('/api/manage/branch', {
+            'name': 'Branch #3', 'bank_id': self.bank.id, 'manager_id': manager.id}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(Branch.objects.get(name='Branch #3').bank_id, self.bank.id)
+
+    def test_unknown_branch_is_rejected(self):
+        response = self.client.post('/api/service/account', {'src_branch_id': 999}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_branch_missing_from_stale_cache_is_loaded(self):
+        branch = Branch.objects.create(name='Branch #3', bank=self.bank,
+                                       manager=self.create_user('9120000003', RoleType.BRANCH_MANAGER.value))
+        # a process that never saw the version bump of this save
+        references.refresh(force=True)
+        references.tables['branch'].pop(branch.id)
+        response = self.client.post('/api/service/account', {'src_branch_id': branch.id}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertIn(branch.id, references.tables['branch'])
+
+    def test_lookups_are_served_from_memory(self):
+        references.refresh(force=True)
+        with self.assertNumQueries(0):
+            self.assertEqual(references.branch(self.branch.id).bank_id, self.bank.id)
+            self.assertEqual(references.bank(self.bank.id).name, 'Bonus')
+
+    def captured_post(self, user, path, data, warm):
+        if warm:
+            references.refresh(force=True)
+        else:
+            # a process that has not loaded the references yet
+            references.version, references.tables = None, {'branch': {}, 'bank': {}}
+        client = self.client_for(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post(path, data, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return [query['sql'] for query in queries.captured_queries]
+
+    def assertReferencesCostTwoQueriesCold(self, path, data, users, table):
+        cold = self.captured_post(users[0], path, data, warm=False)
+        warm = self.captured_post(users[1], path, data, warm=True)
+        self.assertFalse([sql for sql in warm if re.search(r'FROM [`"]manage_(branch|bank)[`"]', sql)], warm)
+        # nor is the created row read back
+        self.assertFalse([sql for sql in warm if re.search(r'FROM [`"]%s[`"].* WHERE [`"]%s[`"]\.[`"]id[`"] ='
+                                                           % (table, table), sql)], warm)
+        # the cold request loads the branch and the bank tables once, nothing else differs
+        self.assertEqual(len(cold), len(warm) + 2, '\n'.join(cold))
+
+    def test_account_request_queries(self):
+        users = [self.user, self.create_user('9121111112')]
+        # a block of account numbers for both requests, reserving one is not what is measured
+        allocator.reserve_block()
+        self.assertReferencesCostTwoQueriesCold('/api/service/account', {'src_branch_id': self.branch.id}, users,
+                                                'service_account')
+
+    def test_loan_request_queries(self):
+        users = [self.user, self.create_user('9121111112')]
+        for number, user in enumerate(users):
+            Account.objects.create(number='600000000000000%d' % number, owner=user, src_branch=self.branch)
+        self.assertReferencesCostTwoQueriesCold('/api/service/loan', {'branch_id': self.branch.id, 'amount': 1200000,
+                                                                      'type': '12'}, users, 'service_loan')
+
+
+@skipIf(orjson is None, 'orjson is not installed')
+class RendererTests(TestCase):
+
+    def render(self, dumps, data):
+        renderer = BonusResponseRenderer()
+        renderer.dumps = dumps
+        return json.loads(renderer.render(data))
+
+    def test_encoders_render_the_same_envelope(self):
+        for data in (transaction_rows(100), {'detail': {'amount': ['too small'], 'id': [None, 'x']}}, None):
+            self.assertEqual(self.render(fast_dumps, data), self.render(std_dumps, data))
+
+
+def slow_list(self, request):
+    # stands for the queries and serializers of a heavy listing
+    time.sleep(0.5)
+    return Response([], status=status.HTTP_200_OK)
+
+
+@override_settings(ROOT_URLCONF='service.tests')
+@mock.patch.object(AccountViewSet, 'list', slow_list)
+class AsyncViewLoadTests(BankFixture, TransactionTestCase):
+    concurrency = 5
+
+    def setUp(self):
+        self.user = self.create_user('9121111111')
+
+    def load(self, path):
+        client = AsyncClient()
+
+        async def requests():
+            return await asyncio.gather(*[client.get(path, AUTHORIZATION='Token ' + self.user.token)
+                                          for _ in range(self.concurrency)])
+
+        started = time.perf_counter()
+        responses = asyncio.run(requests())
+        elapsed = time.perf_counter() - started
+        self.assertEqual([response.status_code for response in responses], [200] * self.concurrency)
+        return elapsed
+
+    def test_async_view_serves_requests_concurrently(self):
+        # sync views share one thread under asgi, the requests queue up behind each other
+        self.assertGreater(self.load('/sync/account'), 0.5 * self.concurrency * 0.9)
+        self.assertLess(self.load('/async/account'), 0.5 * 2)
+
+    def test_async_view_keeps_rest_framework_checks(self):
+        manager = self.create_user('9120000001', RoleType.BRANCH_MANAGER.value)
+        response = asyncio.run(AsyncClient().get('/async/account', AUTHORIZATION='Token ' + manager.token))
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(json.loads(response.content)['message'], 'only users are permitted. ')
+
+
+class AccountNumberTests(BankFixture, TestCase):
+
+    def setUp(self):
+        self.create_bank()
+        # blocks reserved by earlier tests were rolled back with them
+        allocator.next_value = allocator.end_value = 0
+
+    def test_interest_job_reserves_no_numbers(self):
+        for i in range(3):
+            Account.objects.create(number='60000000000000%02d' % i, owner=self.create_user('912222222%d' % i),
+                                   src_branch=self.branch, credit=1000000)
+        accrue_interest(batch_size=2)
+        self.assertEqual(Account.objects.filter(credit__gt=1000000).count(), 3)
+        self.assertFalse(AccountNumberBlock.objects.exists())
+        self.assertEqual(allocator.next_value, 0)
+
+    def test_created_accounts_get_distinct_valid_numbers(self):
+        numbers = []
+        for i in range(3):
+            user = self.create_user('912222222%d' % i)
+            response = self.client_for(user).post('/api/service/account', {'src_branch_id': self.branch.id},
+                                                  format='json')
+            self.assertEqual(response.status_code, 201, response.content)
+            numbers.append(Account.objects.get(owner=user).number)
+        self.assertEqual(len(set(numbers)), 3)
+        self.assertTrue(all(len(number) == 16 for number in numbers))
+
+
+class PeriodicJobTests(BankFixture, TestCase):
+
+    def setUp(self):
+        self.create_bank()
+
+    def test_unpaid_installments_are_reminded_once_a_day(self):
+        user = self.create_user('9121111111')
+        account = Account.objects.create(number='6000000000000001', owner=user, src_branch=self.branch)
+        originate_loan(user, self.branch, 1200000, '12', account)
+        Account.objects.filter(pk=account.pk).update(credit=0)
+        Installment.objects.filter(debtor=user).update(pay_date=timezone.now() - datetime.timedelta(days=1))
+
+        settle_installments()
+        settle_installments()
+        self.assertEqual(SmsOutbox.objects.filter(mobile=user.mobile).count(), 12)
+
+        Installment.objects.update(reminded_on=timezone.localdate() - datetime.timedelta(days=1))
+        settle_installments()
+        self.assertEqual(SmsOutbox.objects.filter(mobile=user.mobile).count(), 24)
+
+    def test_shards_extend_the_job_lock(self):
+        token = acquire_job_lock('calculate_loans', ttl=1)
+        run_job_shard('calculate_loans', 0, token)
+        locked_until = JobCheckpoint.objects.get(code='calculate_loans').locked_until
+        self.assertGreater(locked_until, timezone.now() + datetime.timedelta(seconds=60))
+
+    @mock.patch('SimpleBank.utils.celeryTasks.chord')
+    def test_lock_is_released_when_a_shard_fails(self, chord):
+        token = run_periodic_job('calculate_loans')
+        callback = chord.return_value.call_args[0][0]
+        self.assertEqual(callback.options['link_error'][0]['task'], 'SimpleBank.utils.celeryTasks.finish_periodic_job')
+        self.assertEqual(list(callback.options['link_error'][0]['args']), ['calculate_loans', token])
+
+
+class InterestAccrualTests(BankFixture, TestCase):
+
+    def setUp(self):
+        self.create_bank()
+        self.accounts = [Account.objects.create(number='600000000000001%d' % i, src_branch=self.branch,
+                                                owner=self.create_user('912111111%d' % i), credit=1000000 * (i + 1))
+                         for i in range(3)]
+        self.day = datetime.date(2026, 1, 10)
+
+    def credits(self):
+        return list(Account.objects.order_by('id').values_list('credit', flat=True))
+
+    def test_second_tick_of_the_day_pays_nothing(self):
+        accrue_interest(business_date=self.day)
+        credits = self.credits()
+        with self.assertNumQueries(1):
+            self.assertEqual(accrue_interest(business_date=self.day).rows, 0)
+        self.assertEqual(self.credits(), credits)
+        self.assertEqual(InterestAccrual.objects.count(), 3)
+
+    def test_missed_days_are_paid_once_each(self):
+        accrue_interest(business_date=self.day)
+        expected = self.credits()
+        for _ in range(3):
+            expected = [credit + round(credit * settings.YEARLY_INTEREST_PERCENT / 100 / 365) for credit in expected]
+
+        accrue_interest(business_date=self.day + datetime.timedelta(days=3))
+        self.assertEqual(self.credits(), expected)
+        for account in self.accounts:
+            days = account.interest_accruals.order_by('business_date').values_list('business_date', flat=True)
+            self.assertEqual(list(days), [self.day + datetime.timedelta(days=days) for days in range(4)])
+
+        # the ledger alone keeps a day from being paid twice, even without the checkpoint
+        JobCheckpoint.objects.all().delete()
+        accrue_interest(business_date=self.day + datetime.timedelta(days=3))
+        self.assertEqual(self.credits(), expected)
+        self.assertEqual(InterestAccrual.objects.count(), 12)
+
+    def test_crashed_pass_resumes_after_its_watermark(self):
+        chunks, crashes = [], [2]
+
+        def failing_chunk(chunk, business_date):
+            chunks.append(list(chunk.values_list('id', flat=True)))
+            if len(chunks) in crashes:
+                raise OperationalError('lost the connection')
+            return accrue_chunk(chunk, business_date)
+
+        with mock.patch('SimpleBank.utils.interestEngine.accrue_chunk', failing_chunk):
+            with self.assertRaises(OperationalError):
+                accrue_interest(batch_size=1, business_date=self.day)
+            checkpoint = JobCheckpoint.objects.get(code='calculate_daily_interest')
+            self.assertEqual((checkpoint.watermark, checkpoint.is_completed), (self.accounts[0].id, False))
+            # the second chunk was rolled back, nothing of it was paid
+            self.assertEqual(InterestAccrual.objects.count(), 1)
+
+            chunks.clear()
+            crashes.clear()
+            accrue_interest(batch_size=1, business_date=self.day)
+        self.assertEqual(chunks, [[self.accounts[1].id], [self.accounts[2].id]])
+        self.assertEqual(InterestAccrual.objects.filter(business_date=self.day).count(), 3)
+        self.assertTrue(JobCheckpoint.objects.get(code='calculate_daily_interest').is_completed)
+
+
+class SmsOutboxTests(BankFixture, TestCase):
+
+    def setUp(self):
+        self.create_bank()
+        self.user = self.create_user('9121111111')
+
+    def test_rows_roll_back_with_the_business_write(self):
+        Account.objects.create(number='6000000000000001', owner=self.user, src_branch=self.branch)
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertRaises(IntegrityError):
+                with transaction.atomic():
+                    account = Account.objects.create(number='6000000000000002', owner=self.user,
+                                                     src_branch=self.other_branch)
+                    manage_sms(self.user, account, 'account')
+                    Account.objects.create(number='6000000000000001', owner=self.user, src_branch=self.branch)
+        self.assertFalse(SmsOutbox.objects.exists())
+        self.assertEqual(callbacks, [])
+
+    @mock.patch('SimpleBank.utils.smsService.send_SMS')
+    def test_dispatch_sends_each_chunk_once_without_duplicates(self, send_SMS):
+        enqueue_sms([('+989121111111', 'first'), ('+989121111111', 'first'), ('+989121111112', 'second'),
+                     ('+989121111111', 'first'), ('+989121111113', 'third')])
+        self.assertEqual(dispatch_outbox(batch_size=3), 5)
+        self.assertEqual([call.args[0] for call in send_SMS.delay.call_args_list], [
+            [('+989121111111', 'first'), ('+989121111112', 'second')],
+            [('+989121111111', 'first'), ('+989121111113', 'third')],
+        ])
+        self.assertFalse(SmsOutbox.objects.filter(Q(is_sent=False) | Q(sent_at=None)).exists())
+        # nothing is left for the next run
+        self.assertEqual(dispatch_outbox(batch_size=3), 0)
+        self.assertEqual(send_SMS.delay.call_count, 2)
+
+    def test_purge_keeps_unsent_and_recent_rows(self):
+        enqueue_sms([('+989121111111', 'message %d' % i) for i in range(5)])
+        rows = list(SmsOutbox.objects.order_by('id').values_list('id', flat=True))
+        old = timezone.now() - datetime.timedelta(days=settings.SMS_OUTBOX_RETENTION_DAYS + 1)
+        SmsOutbox.objects.filter(id__in=rows[:3]).update(is_sent=True, sent_at=old)
+        SmsOutbox.objects.filter(id=rows[3]).update(is_sent=True, sent_at=timezone.now())
+
+        self.assertEqual(purge_outbox(batch_size=2), 3)
+        self.assertEqual(list(SmsOutbox.objects.order_by('id').values_list('id', flat=True)), rows[3:])
+
+
+class LedgerConcurrencyTests(BankFixture, TransactionTestCase):
+    writers = 8
+    transfers = 10
+    amount = 1000
+
+    def setUp(self):
+        self.create_bank()
+        self.users = [self.create_user('912111111%d' % i) for i in range(2)]
+        self.accounts = [Account.objects.create(number='600000000000000%d' % i, owner=user, src_branch=self.branch,
+                                                credit=1000000) for i, user in enumerate(self.users)]
+
+    def post(self, src, dest):
+        while True:
+            try:
+                return post_transaction(self.users[src], TransactionType.DEPOSIT.value, self.amount,
+                                        self.accounts[dest], self.accounts[src])
+            except OperationalError:
+                # sqlite locks the whole database instead of rows, the writer tries again
+                time.sleep(0.001)
+
+    def writer(self, direction, errors):
+        try:
+            for _ in range(self.transfers):
+                self.post(direction, 1 - direction)
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            connection.close()
+
+    def test_parallel_transfers_lose_no_updates(self):
+        errors = []
+        threads = [threading.Thread(target=self.writer, args=(i % 2, errors)) for i in range(self.writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        # as many transfers went each way, so both balances are back where they started
+        self.assertEqual(Transaction.objects.count(), self.writers * self.transfers)
+        self.assertEqual([account.credit for account in Account.objects.order_by('id')], [1000000, 1000000])
+        self.assertEqual([statistic.credit for statistic in UserStatistic.objects.filter(user__in=self.users)
+                         .order_by('user_id')], [0, 0])
+        self.assertEqual(sorted(DailyTransactionUsage.objects.filter(user__in=self.users)
+                                .values_list('amount', flat=True)),
+                         [self.writers // 2 * self.transfers * self.amount] * 2)
+
+
+class QueryPlanTests(BankFixture, TestCase):
+
+    def setUp(self):
+        self.create_bank()
+        self.user, other = self.create_user('9121111111'), self.create_user('9121111112')
+        self.account = Account.objects.create(number='6000000000000001', owner=self.user, src_branch=self.branch,
+                                              credit=5000000)
+        self.other_account = Account.objects.create(number='6000000000000002', owner=other,
+                                                    src_branch=self.branch)
+        Transaction.objects.bulk_create([Transaction(owner=self.user, src_account=self.account,
+                                                     dest_account=self.other_account, amount=1000 + i,
+                                                     type=TransactionType.DEPOSIT.value) for i in range(5)])
+        originate_loan(self.user, self.branch, 1200000, '12', self.account)
+
+    def full_scans(self, sql, params=()):
+        """The steps of the plan of `sql` that read a whole table or index."""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute('EXPLAIN ' + sql, params)
+                # the access type is the fifth column, ALL reads every row
+                steps = [(row[4] == 'ALL', 'filesort' in (row[-1] or ''), str(row)) for row in cursor.fetchall()]
+            else:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                # sqlite reads a whole table or index with SCAN and looks rows up with SEARCH
+                steps = [(detail.startswith('SCAN '), 'TEMP B-TREE' in detail, detail)
+                         for _, _, _, detail in cursor.fetchall()]
+        sorts = any(sort for _, sort, _ in steps)
+        # walking a table in the order asked for and stopping at the LIMIT is not a full read
+        if ' LIMIT ' in sql and not sorts:
+            return []
+        return [step for scan, sort, step in steps if scan or sort]
+
+    def captured_selects(self, *requests):
+        with CaptureQueriesContext(connection) as queries:
+            for client, path, params in requests:
+                response = client.get(path, params)
+                self.assertEqual(response.status_code, 200, path)
+                b''.join(getattr(response, 'streaming_content', []))
+        return [query['sql'] for query in queries.captured_queries if query['sql'].startswith('SELECT')]
+
+    def test_view_queries_use_indexes(self):
+        client = self.client_for(self.user)
+        page = client.get('/api/service/transaction', {'page_size': 2}).data
+        selects = self.captured_selects(
+            (client, '/api/service/account', {}),
+            (client, '/api/service/account/%d' % self.account.id, {}),
+            (client, '/api/service/loan', {}),
+            (client, '/api/service/transaction', {'page_size': 2}),
+            (client, page['next'], {}),
+            (client, '/api/service/transaction', {'stream': 'ndjson'}),
+            (self.client_for(self.branch.manager), '/api/service/report/transaction', {'page_size': 2}))
+        self.assertTrue(any('"service_transaction"."src_account_id" =' in sql for sql in selects))
+        self.assertTrue(any(' LIMIT 2' in sql and 'INNER JOIN' in sql for sql in selects))
+        for sql in selects:
+            if sql.startswith('SELECT COUNT(*)'):
+                # the page count of the staff report counts the table, that is what it reports
+                continue
+            self.assertEqual(self.full_scans(sql), [], sql)
+
+    def test_job_queries_use_indexes(self):
+        now = timezone.now()
+        for queryset in (
+                # the loan settler, its backfill and the due installment scan of the periodic jobs
+                id_range(Loan.objects.filter(is_settled=FALSE, open_installments__lte=0), 0, 1000),
+                id_range(Loan.objects.filter(is_settled=FALSE, open_installments__isnull=True), 0, 1000),
+                id_range(Installment.objects.filter(pay_date__lt=now, is_settled=FALSE), 0, 1000)):
+            self.assertEqual(self.full_scans(*queryset.query.sql_with_params()), [], queryset.query)
+
+
+class TransactionReportTests(BankFixture, TestCase):
+
+    def setUp(self):
+        self.create_bank()
+        users = [self.create_user('912111111%d' % i) for i in range(3)]
+        accounts = [Account.objects.create(number='600000000000000%d' % i, owner=user, src_branch=self.branch,
+                                           credit=1000000) for i, user in enumerate(users)]
+        Transaction.objects.bulk_create([
+            Transaction(owner=users[i % 3], src_account=accounts[i % 3], dest_account=accounts[(i + 1) % 3],
+                        amount=1000 + i, type=TransactionType.DEPOSIT.value) for i in range(60)])
+        self.client = APIClient()
+        self.client.force_authenticate(self.branch.manager)
+
+    def test_report_queries_do_not_grow_with_the_page(self):
+        for rows in ('', 'flat'):
+            for page_size in (1, 10, 60):
+                # one COUNT and one SELECT joining the owners and accounts, whatever the page holds
+                with self.assertNumQueries(2):
+                    response = self.client.get('/api/service/report/transaction',
+                                               {'page_size': page_size, 'rows': rows})
+                self.assertEqual(response.status_code, 200, response.content)
+                self.assertEqual(response.data['count'], 60)
+                self.assertEqual(len(response.data['results']), page_size)
+
+
+class UserStatisticCreditTests(BankFixture, TestCase):
+    seed = 17
+    steps = 60
+
+    def setUp(self):
+        self.create_bank()
+        self.random = random.Random(self.seed)
+        self.users = [self.create_user('912111111%d' % i) for i in range(4)]
+        for user in self.users:
+            response = self.client_for(user).post('/api/service/account', {'src_branch_id': self.branch.id},
+                                                  format='json')
+            self.assertEqual(response.status_code, 201, response.content)
+        self.business_date = timezone.localdate()
+
+    def account(self, user):
+        return Account.objects.filter(owner=user, is_active=True).first()
+
+    def assertCreditsMatchBalances(self, step):
+        for statistic in UserStatistic.objects.filter(user__in=self.users):
+            balance = Account.objects.filter(owner=statistic.user_id, is_active=True) \
+                .aggregate(total=Sum('credit'))['total'] or 0
+            self.assertEqual(statistic.credit, balance, 'user %s after %s' % (statistic.user_id, step))
+
+    def deposit_cash(self, user):
+        post_transaction(user, TransactionType.DEPOSIT_CASH.value, self.random.randrange(10000, 500000),
+                         self.account(user))
+
+    def transfer(self, user):
+        dest = self.account(self.random.choice([other for other in self.users if other != user]))
+        if dest is not None:
+            post_transaction(user, TransactionType.DEPOSIT.value, self.random.randrange(1000, 300000), dest,
+                             self.account(user))
+
+    def withdraw(self, user):
+        post_transaction(user, TransactionType.WITHDRAW.value, self.random.randrange(1000, 300000),
+                         self.account(user))
+
+    def take_loan(self, user):
+        originate_loan(user, self.branch, 1200000, '12', self.account(user))
+
+    def settle_installments(self, user):
+        # the next installment falls due
+        installment = Installment.objects.filter(debtor=user, is_settled=False).order_by('pay_date').first()
+        if installment is not None:
+            Installment.objects.filter(pk=installment.pk).update(pay_date=timezone.now() - datetime.timedelta(days=1))
+        settle_installments()
+
+    def accrue_interest(self, user):
+        self.business_date += datetime.timedelta(days=1)
+        accrue_interest(business_date=self.business_date)
+
+    def close(self, user):
+        response = self.client_for(user).delete('/api/service/account/close',
+                                                {'src_branch_id': self.other_branch.id}, format='json')
+        self.assertIn(response.status_code, (200, 403), response.content)
+
+    def test_credit_is_the_sum_of_active_balances(self):
+        operations = [self.deposit_cash, self.transfer, self.withdraw, self.take_loan, self.settle_installments,
+                      self.accrue_interest, self.close]
+        for step in range(self.steps):
+            open_users = [user for user in self.users if self.account(user) is not None]
+            if not open_users:
+                break
+            operation = self.random.choice(operations)
+            user = self.random.choice(open_users)
+            try:
+                operation(user)
+            except (exceptions.MinBalanceLimit, exceptions.AccountLimitExceeded):
+                pass
+            self.assertCreditsMatchBalances('%s of %s at step %d' % (operation.__name__, user.id, step))
+
+
+class StatisticReconcileTests(BankFixture, TestCase):
+    fields = ('credit', 'debt', 'loans_gotten', 'loans_unsettled', 'account_closed')
+
+    def setUp(self):
+        self.create_bank()
+        self.users = [self.create_user('912111111%d' % i) for i in range(3)]
+        first, second, third = self.users
+        account = Account.objects.create(number='6000000000000001', owner=first, src_branch=self.branch,
+                                         credit=500000)
+        Account.objects.create(number='6000000000000002', owner=second, src_branch=self.branch, credit=700000)
+        Account.objects.create(number='6000000000000003', owner=third, src_branch=self.branch, is_active=False)
+        Account.objects.create(number='6000000000000004', owner=third, src_branch=self.other_branch, credit=300000)
+        UserStatistic.objects.filter(user=first).update(credit=500000)
+        UserStatistic.objects.filter(user=second).update(credit=700000)
+        UserStatistic.objects.filter(user=third).update(credit=300000, account_closed=True)
+        originate_loan(first, self.branch, 1200000, '12', account)
+        Installment.objects.filter(pk=Installment.objects.filter(debtor=first).order_by('id')[0].pk) \
+            .update(is_settled=True)
+        UserStatistic.objects.filter(user=first).update(debt=F('debt') - 100000)
+
+    def statistics(self):
+        return {statistic['user_id']: tuple(statistic[field] for field in self.fields)
+                for statistic in UserStatistic.objects.filter(user__in=self.users).values('user_id', *self.fields)}
+
+    def drift(self):
+        UserStatistic.objects.update(credit=1, debt=2, loans_gotten=3, loans_unsettled=4, account_closed=False)
+
+    def test_flush_writes_every_users_deltas_in_one_update(self):
+        first, second, third = self.users
+        before = self.statistics()
+        buffer = StatisticBuffer()
+        buffer.add(first.id, credit=1000, debt=-200)
+        buffer.add(second.id, credit=50)
+        buffer.add(second.id, credit=-20, loans_gotten=1)
+        buffer.add(third.id, credit=0)
+        with self.assertNumQueries(1):
+            buffer.flush()
+        after = self.statistics()
+        self.assertEqual(after[first.id],
+                         (before[first.id][0] + 1000, before[first.id][1] - 200) + before[first.id][2:])
+        self.assertEqual(after[second.id], (before[second.id][0] + 30, before[second.id][1],
+                                            before[second.id][2] + 1) + before[second.id][3:])
+        self.assertEqual(after[third.id], before[third.id])
+        with self.assertNumQueries(0):
+            buffer.flush()
+
+    def test_reconcile_restores_drifted_statistics(self):
+        first, second, third = self.users
+        expected = {first.id: (1700000, 1100000, 1, 1, False), second.id: (700000, 0, 0, 0, False),
+                    third.id: (300000, 0, 0, 0, True)}
+        self.assertEqual(self.statistics(), expected)
+        self.drift()
+        self.assertEqual(reconcile(batch_size=2), UserStatistic.objects.count())
+        self.assertEqual(self.statistics(), expected)
+
+    def test_command_reconciles_every_statistic(self):
+        expected = self.statistics()
+        self.drift()
+        out = StringIO()
+        call_command('reconcile_statistics', batch_size=2, stdout=out)
+        self.assertIn('%d user statistics reconciled.' % UserStatistic.objects.count(), out.getvalue())
+        self.assertEqual(self.statistics(), expected)
+
+
+class ReplicaRoutingTests(BankFixture, TransactionTestCase):
+    """
+    Routing against a second SQLite database standing in for the replica.
+    Nothing replicates into it, so a read shows which database served it.
+    """
+
+    def setUp(self):
+        # a fresh one per test, registered after the test case guarded its connections; the
+        # runner only knows the configured ones and would neither create nor flush it
+        handle, self.replica_name = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        connections.databases[REPLICA] = dict(connections.databases[DEFAULT_DB_ALIAS], NAME=self.replica_name)
+        with connections[REPLICA].schema_editor() as editor:
+            for model in apps.get_models():
+                editor.create_model(model)
+        cache.clear()
+        self.create_bank()
+
+    def tearDown(self):
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.databases[REPLICA]
+        os.remove(self.replica_name)
+
+    def test_marked_reads_go_to_the_replica(self):
+        self.assertEqual(Branch.objects.count(), 2)
+        with use_replica():
+            self.assertEqual(Branch.objects.count(), 0)
+            # writes and reads inside a transaction stay on the primary
+            with transaction.atomic():
+                self.assertEqual(Branch.objects.count(), 2)
+
+    def test_report_is_read_from_the_replica(self):
+        user = self.create_user('9121111111')
+        account = Account.objects.create(number='6000000000000001', owner=user, src_branch=self.branch)
+        Transaction.objects.create(owner=user, dest_account=account, amount=1000,
+                                   type=TransactionType.DEPOSIT_CASH.value)
+        response = self.client_for(self.branch.manager).get('/api/service/report/transaction')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['count'], 0)
+
+    def test_export_is_read_from_the_replica(self):
+        user = self.create_user('9121111111')
+        account = Account.objects.create(number='6000000000000001', owner=user, src_branch=self.branch)
+        for instance in (self.owner, self.bank, self.branch.manager, self.branch, user, account):
+            instance.save(using=REPLICA, force_insert=True)
+        # only the replica has the transaction, the body is written after the view returned
+        Transaction.objects.using(REPLICA).create(owner=user, dest_account=account, amount=1000,
+                                                  type=TransactionType.DEPOSIT_CASH.value)
+        response = self.client_for(user).get('/api/service/transaction', {'stream': 'ndjson'})
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 1)
+
+    @mock.patch('SimpleBank.utils.smsService.schedule_dispatch')
+    def test_writers_read_their_own_writes(self, schedule_dispatch):
+        writer, reader = self.create_user('9121111111'), self.create_user('9121111112')
+        Account.objects.create(number='6000000000000002', owner=reader, src_branch=self.branch)
+        response = self.client_for(writer).post('/api/service/account', {'src_branch_id': self.branch.id},
+                                                format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+        response = self.client_for(writer).get('/api/service/account')
+        self.assertEqual(len(response.data), 1, response.data)
+        response = self.client_for(reader).get('/api/service/account')
+        self.assertEqual(len(response.data), 0, response.data)
+
+
+class MetricsEndpointTests(BankFixture, TestCase):
+
+    def setUp(self):
+        self.create_bank()
+
+    @override_settings(METRICS_TOKEN='')
+    def test_metrics_are_closed_without_a_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_every_job_reports_its_last_run(self):
+        user = self.create_user('9121111111')
+        account = Account.objects.create(number='6000000000000001', owner=user, src_branch=self.branch,
+                                         credit=5000000)
+        originate_loan(user, self.branch, 1200000, '12', account)
+        Installment.objects.update(pay_date=timezone.now() - datetime.timedelta(days=1))
+        for code in ('calculate_daily_interest', 'calculate_installments', 'calculate_loans'):
+            JOBS[code].run_shard(0)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        gauges = dict(line.rsplit(' ', 1) for line in response.content.decode().splitlines()
+                      if line.startswith('simplebank_job_last_run_rows'))
+        self.assertEqual(gauges, {
+            'simplebank_job_last_run_rows{job="calculate_daily_interest"}': '1',
+            'simplebank_job_last_run_rows{job="calculate_installments"}': '12',
+            'simplebank_job_last_run_rows{job="calculate_loans"}': '1',
+        })
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_metrics_need_the_scrape_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        # a user token does not open them either
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Token ' + self.owner.token)
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'simplebank_http_requests_total', response.content)
+
+
+class LoanImportTests(BankFixture, TestCase):
+
+    def setUp(self):
+        self.create_bank()
+        self.users = [self.create_user('912111111%d' % i) for i in range(3)]
+        for i, user in enumerate(self.users[:2]):
+            Account.objects.create(number='600000000000000%d' % i, owner=user, src_branch=self.branch)
+
+    def import_loans(self, *rows):
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w') as file:
+            file.write('mobile,branch_id,amount,type\n' + ''.join('%s,%s,%s,%s\n' % row for row in rows))
+        self.addCleanup(os.remove, path)
+        out = StringIO()
+        call_command('import_loans', path, batch_size=2, stdout=out)
+        return out.getvalue()
+
+    def test_loans_are_granted_with_their_schedules(self):
+        output = self.import_loans(('9121111110', self.branch.id, 1200000, '12'),
+                                   ('9121111111', self.branch.id, 1000001, '24'),
+                                   ('9121111110', self.other_branch.id, 2400000, '24'),
+                                   ('9121111112', self.branch.id, 1200000, '12'))
+        self.assertIn('Granted 3 of 4 loans', output)
+        for loan in Loan.objects.all():
+            installments = Installment.objects.filter(loan=loan)
+            self.assertEqual(installments.count(), int(loan.type))
+            self.assertEqual(sum(installment.amount for installment in installments), loan.amount)
+        self.assertEqual([(account.owner_id, account.credit) for account in Account.objects.order_by('id')],
+                         [(self.users[0].id, 3600000), (self.users[1].id, 1000001)])
+        self.assertEqual(UserStatistic.objects.get(user=self.users[0]).loans_unsettled, 2)
+        self.assertFalse(Loan.objects.filter(applicant=self.users[2]).exists())
+
+    def test_bad_rows_stop_the_import(self):
+        with self.assertRaisesMessage(CommandError, 'line 3'):
+            self.import_loans(('9121111110', self.branch.id, 1200000, '12'),
+                              ('9121111111', self.branch.id, 10, '12'),
+                              ('9129999999', self.branch.id, 1200000, '12'),
+                              ('9121111111', self.branch.id, 1200000, '36'))
+        self.assertFalse(Loan.objects.exists())
+
+
+class ConnectionBenchmarkTests(TransactionTestCase):
+
+    def test_benchmark_reports_both_modes(self):
+        out = StringIO()
+        call_command('benchmark_connections', requests=3, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines], ['per', 'per', settings.DB_PROFILE, settings.DB_PROFILE])
+        self.assertEqual([line.split()[2] for line in lines], ['/api/user/login', '/api/service/account'] * 2)
+        self.assertTrue(all('3 requests: p50' in line and 'p99' in line for line in lines))
+        # the profile's settings are restored and the benchmark user is gone
+        self.assertEqual(connection.settings_dict['CONN_MAX_AGE'],
+                         settings.DB_CONNECTION_PROFILES[settings.DB_PROFILE]['CONN_MAX_AGE'])
+        self.assertFalse(User.objects.exists())
+
+
+class InterestBenchmarkTests(TestCase):
+
+    def test_benchmark_compares_both_and_leaves_nothing_behind(self):
+        out = StringIO()
+        call_command('benchmark_interest', accounts=30, baseline=10, batch_size=7, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[:3] for line in lines], [['save', 'loop', '10'], ['engine', '30', 'accounts:']])
+        self.assertFalse(Account.objects.exists() or User.objects.exists() or InterestAccrual.objects.exists())
+
+
+class SmsGatewayBenchmarkTests(TestCase):
+
+    def test_every_message_reaches_the_gateway_in_every_pool(self):
+        out = StringIO()
+        call_command('benchmark_sms_gateway', messages=30, batch_size=4, latency=0, pools='1,3', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[:3] for line in lines], [['pool', '1', '30'], ['pool', '3', '30']])
+        self.assertTrue(all('8 batches' in line and 'messages/sec' in line for line in lines))
+
+
+class TransactionHistoryTests(BankFixture, TestCase):
+
+    def setUp(self):
+        self.create_bank()
+        self.user, other = self.create_user('9121111111'), self.create_user('9121111112')
+        own = [Account.objects.create(number='600000000000000%d' % i, owner=self.user, src_branch=branch)
+               for i, branch in enumerate((self.branch, self.other_branch))]
+        foreign = Account.objects.create(number='6000000000000009', owner=other, src_branch=self.branch)
+        moves = [(None, own[0]), (own[0], own[1]), (foreign, own[1]), (own[1], foreign), (None, foreign),
+                 (own[0], foreign), (None, own[1])]
+        Transaction.objects.bulk_create([Transaction(owner=self.user, src_account=src, dest_account=dest,
+                                                     amount=1000, type=TransactionType.DEPOSIT.value)
+                                         for src, dest in moves])
+        # ties on created_at are broken by id
+        rows = list(Transaction.objects.order_by('id'))
+        start = timezone.now()
+        for i, row in enumerate(rows):
+            Transaction.objects.filter(pk=row.pk).update(created_at=start + datetime.timedelta(seconds=i // 2))
+        # newest first is highest id first, with pairs of rows sharing a timestamp
+        self.expected = [row.id for row in reversed(rows)
+                         if row.dest_account.owner_id == self.user.id or
+                         (row.src_account is not None and row.src_account.owner_id == self.user.id)]
+        self.client = self.client_for(self.user)
+
+    def test_cursor_walks_the_keyset_both_ways(self):
+        pages, url = [], '/api/service/transaction?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            pages.append(response.data)
+            url = response.data['next']
+        self.assertEqual([row['id'] for page in pages for row in page['results']], self.expected)
+        self.assertIsNone(pages[0]['previous'])
+
+        response = self.client.get(pages[-1]['previous'])
+        self.assertEqual(response.data['results'], pages[-2]['results'])
+
+    def test_export_streams_the_whole_history(self):
+        response = self.client.get('/api/service/transaction', {'stream': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], self.expected)
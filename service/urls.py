@@ -1,5 +1,7 @@
+from django.conf import settings
 from django.urls import path, include, re_path
 from django.conf.urls import url
+from SimpleBank.utils.asyncViews import async_view
 from .views import AccountViewSet, TransactionViewSet, AccountCloseApiView, LoanViewSet, TransactionListView
 from rest_framework import routers
 
@@ -15,3 +17,11 @@ urlpatterns = [
     path('account/close', AccountCloseApiView.as_view()),
     re_path('^', include(router.urls)),
 ]
+
+# under an asgi server the read-heavy endpoints are served by async views
+if settings.ASYNC_READ_VIEWS:
+    urlpatterns = [
+        path('account', async_view(AccountViewSet.as_view({'get': 'list', 'post': 'create'}))),
+        path('account/<int:pk>', async_view(AccountViewSet.as_view({'get': 'retrieve'}))),
+        path('loan', async_view(LoanViewSet.as_view({'get': 'list', 'post': 'create'}))),
+    ] + urlpatterns
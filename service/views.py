@@ -3,7 +3,8 @@ from django.shortcuts import get_object_or_404
 from identity.models import UserStatistic
 from .models import Account, Transaction, Loan, Installment
 from .serializers import AccountSerializer, AccountMinimalSerializer, AccountCreateSerializer,\
-    TransactionCreateSerializer, TransactionSerializer, AccountCloseSerializer, LoanSerializer, LoanCreateSerializer
+    TransactionCreateSerializer, TransactionSerializer, TransactionFlatSerializer, AccountCloseSerializer, LoanSerializer,\
+    LoanCreateSerializer
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -13,6 +14,11 @@ from SimpleBank.utils.bonusRenderer import BonusResponseRenderer
 from SimpleBank.utils.customPermissions import IsRegularUser, IsStaff
 from .enums import TransactionType
 from SimpleBank.utils.smsService import manage_sms
+from SimpleBank.utils.smsTemplates import related_fields
+from SimpleBank.utils.pagination import KeysetHistory, TransactionCursorPagination, ReportPagination, stream_ndjson
+from SimpleBank.utils.dbRouter import use_replica
+from django.db.models import prefetch_related_objects
+from django.db.transaction import atomic
 from rest_framework.filters import OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend, FilterSet
 
@@ -21,6 +27,8 @@ class TransactionListView(generics.ListAPIView):
     permission_classes = [IsStaff]
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
+    flat_serializer_class = TransactionFlatSerializer
+    pagination_class = ReportPagination
     filter_backends = (DjangoFilterBackend, OrderingFilter, )
     filterset_fields = ['owner__mobile', 'src_account', 'src_account__owner', 'dest_account', 'dest_account__owner',
                         'amount', 'type']
@@ -29,7 +37,18 @@ class TransactionListView(generics.ListAPIView):
     # in case to change
     def get_queryset(self):
         staff = self.request.user
-        return Transaction.objects.all()
+        return Transaction.objects.select_related('owner', 'src_account__owner', 'dest_account__owner') \
+            .order_by('-id')
+
+    # ?rows=flat gives one denormalized row per transaction for bulk consumers
+    def get_serializer_class(self):
+        if self.request.GET.get('rows') == 'flat':
+            return self.flat_serializer_class
+        return self.serializer_class
+
+    @use_replica()
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
 
 class AccountViewSet(viewsets.ViewSet):
@@ -38,6 +57,7 @@ class AccountViewSet(viewsets.ViewSet):
     response_serializer_class = AccountSerializer
     renderer_classes = [BonusResponseRenderer, ]
 
+    @use_replica()
     def list(self, request):
         if request.GET.get('number') is not None:
             queryset = Account.objects.filter(number=request.GET.get('number'), is_active=True)
@@ -57,9 +77,10 @@ class AccountViewSet(viewsets.ViewSet):
     def create(self, request):
         serializer = self.serializer_class(data=request.data, context={'owner': request.user})
         if serializer.is_valid():
-            serializer.save()
-            account = Account.objects.get(pk=serializer.data.get('id'))
-            manage_sms(request.user, account, 'account')
+            with atomic():
+                # the saved instance already holds the owner and the cached branch, nothing is read back
+                account = serializer.save()
+                manage_sms(request.user, account, 'account')
             return Response(self.response_serializer_class(account).data,
                             status=status.HTTP_201_CREATED)
         else:
@@ -90,18 +111,33 @@ class AccountCloseApiView(APIView):
             return Response(response, status=status.HTTP_400_BAD_REQUEST)
 
 
+def transaction_history(user):
+    # both sides of each of the user's accounts, every one read in order from its (account, created_at, id) index
+    branches = []
+    for account in Account.objects.filter(owner=user).values_list('id', flat=True):
+        branches += [Transaction.objects.filter(dest_account_id=account),
+                     Transaction.objects.filter(src_account_id=account)]
+    return KeysetHistory(branches, Transaction.objects.select_related('owner', 'src_account__owner',
+                                                                      'dest_account__owner'))
+
+
 class TransactionViewSet(viewsets.ViewSet):
     permission_classes = (IsRegularUser,)
     serializer_class = TransactionCreateSerializer
     response_serializer_class = TransactionSerializer
+    pagination_class = TransactionCursorPagination
     renderer_classes = [BonusResponseRenderer, ]
 
+    @use_replica()
     def list(self, request):
-        c_get_tweets.delay()
-        queryset = Transaction.objects.filter(Q(dest_account__owner=request.user)
-                                              | Q(src_account__owner=request.user))
-        serializer = self.serializer_class(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        history = transaction_history(request.user)
+        # full history export, one json document per line
+        if request.GET.get('stream') == 'ndjson':
+            return stream_ndjson(history, self.response_serializer_class)
+        paginator = self.pagination_class()
+        page = paginator.paginate_history(history, request)
+        serializer = self.response_serializer_class(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     def create(self, request, type):
         data = request.data
@@ -119,9 +155,11 @@ class TransactionViewSet(viewsets.ViewSet):
         serializer = self.serializer_class(data=request.data, context={'type': transaction_type,
                                                                        'owner': request.user})
         if serializer.is_valid():
-            serializer.save()
-            transaction = Transaction.objects.get(pk=serializer.data.get('id'))
-            manage_sms(request.user, transaction, 'transaction')
+            with atomic():
+                serializer.save()
+                transaction = Transaction.objects.select_related(*related_fields('transaction')) \
+                    .get(pk=serializer.data.get('id'))
+                manage_sms(request.user, transaction, 'transaction')
             return Response(self.response_serializer_class(transaction).data,
                             status=status.HTTP_201_CREATED)
         else:
@@ -135,6 +173,7 @@ class LoanViewSet(viewsets.ViewSet):
     response_serializer_class = LoanSerializer
     renderer_classes = [BonusResponseRenderer, ]
 
+    @use_replica()
     def list(self, request):
         queryset = Loan.objects.filter(applicant=request.user)
         serializer = self.serializer_class(queryset, many=True)
@@ -147,16 +186,17 @@ class LoanViewSet(viewsets.ViewSet):
         return Response(serializer.data)
 
     def create(self, request):
-        queryset = Account.objects.filter(owner=request.user)
+        queryset = Account.objects.filter(owner=request.user, is_active=True)
         account = get_object_or_404(queryset)
-        serializer = self.serializer_class(data=request.data, context={'applicant': request.user})
+        serializer = self.serializer_class(data=request.data, context={'applicant': request.user,
+                                                                       'account': account})
 
         if serializer.is_valid():
-            serializer.save()
-            loan = Loan.objects.get(pk=serializer.data.get('id'))
-            account.credit = account.credit + serializer.data.get('amount')
-            account.save()
-            manage_sms(request.user, loan, 'loan')
+            with atomic():
+                loan = serializer.save()
+                # only the installment ids are unknown after their bulk insert
+                prefetch_related_objects([loan], 'Installments_list')
+                manage_sms(request.user, loan, 'loan')
             return Response(self.response_serializer_class(loan).data,
                             status=status.HTTP_201_CREATED)
         else: